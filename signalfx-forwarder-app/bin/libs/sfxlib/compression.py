@@ -0,0 +1,64 @@
+"""
+Compresses a request body as it is encoded.  Encoders yield the body in
+fragments which are buffered up to `BUFFER_SIZE` and fed to the compressor,
+so only the compressed body is ever held in full.
+"""
+from __future__ import absolute_import
+
+import zlib
+
+from .metrics import Measured, clock
+
+COMPRESSIONS = ("gzip", "none")
+
+DEFAULT_LEVEL = 6
+
+BUFFER_SIZE = 64 * 1024
+
+# Makes zlib write a gzip header and trailer rather than zlib's own
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def _join(fragments):
+    if isinstance(fragments[0], bytes):
+        return b"".join(fragments)
+    return "".join(fragments).encode("utf-8")
+
+
+def _buffered(fragments):
+    pending, pending_size = [], 0
+    for fragment in fragments:
+        pending.append(fragment)
+        pending_size += len(fragment)
+        if pending_size >= BUFFER_SIZE:
+            yield _join(pending)
+            pending, pending_size = [], 0
+    if pending:
+        yield _join(pending)
+
+
+def compress(fragments, compression="gzip", level=DEFAULT_LEVEL, metrics=None):
+    """
+    Returns the body made from the str or bytes `fragments` along with the
+    `Content-Encoding` to send it with, which is None if it is uncompressed.
+    The time spent encoding and compressing and the size of the body before
+    and after compression are added to `metrics`, if given.
+    """
+    chunks = _buffered(fragments) if metrics is None else Measured(_buffered(fragments))
+    start = clock()
+
+    if compression == "none":
+        body, content_encoding = b"".join(chunks), None
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+        out = [compressor.compress(data) for data in chunks]
+        out.append(compressor.flush())
+        body, content_encoding = b"".join(out), "gzip"
+
+    if metrics is not None:
+        metrics.add("encode_seconds", chunks.seconds)
+        if content_encoding is not None:
+            metrics.add("gzip_seconds", clock() - start - chunks.seconds)
+        metrics.add("bytes_raw", chunks.size)
+        metrics.add("bytes_compressed", len(body))
+    return body, content_encoding
@@ -0,0 +1,108 @@
+"""
+Caches the access token looked up from splunkd so that every search does not
+have to make the same REST calls before it can send anything.
+"""
+from __future__ import absolute_import, division
+
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DEFAULT_TTL = 300
+
+
+def file_fingerprint(*paths):
+    """
+    Returns a value that changes whenever one of `paths` is created, removed
+    or modified.  Missing files are part of the fingerprint too.
+    """
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            fingerprint.append(None)
+            continue
+        fingerprint.append([stat.st_mtime, stat.st_size])
+    return fingerprint
+
+
+class ConfigCache(object):
+    """
+    A JSON file of values keyed by name, each stored with the time it was
+    fetched and the fingerprint of the configuration it was fetched under.
+    Values expire after `ttl` seconds or as soon as the fingerprint changes.
+    The file holds credentials and is only readable by its owner.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, fingerprint=None):
+        self.path = path
+        self.ttl = ttl
+        self.fingerprint = fingerprint
+        self._entries = None
+
+    def get(self, key, fetch):
+        """
+        Returns the cached value of `key`, calling `fetch` to look it up again
+        if it is missing or stale.  Values of None are never cached.
+        """
+        entry = self._load().get(key)
+        if (
+            entry is not None
+            and entry.get("fingerprint") == self.fingerprint
+            and 0 <= time.time() - entry.get("fetched", 0) < self.ttl
+        ):
+            return entry["value"]
+
+        value = fetch()
+        if value is not None and self.ttl > 0:
+            self._entries[key] = {"value": value, "fetched": time.time(), "fingerprint": self.fingerprint}
+            self._save()
+        return value
+
+    def invalidate(self):
+        self._entries = {}
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path, "rb") as cached:
+                    self._entries = json.loads(cached.read().decode("utf-8"))
+            except (IOError, OSError):
+                pass
+            except ValueError as e:
+                logger.error("status=error, action=config_cache_load, path=%s, error_msg=%s", self.path, e)
+        return self._entries
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory, 0o700)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+
+        tmp_path = "%s.%s.tmp" % (self.path, uuid.uuid4().hex)
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as cached:
+                cached.write(json.dumps(self._entries).encode("utf-8"))
+            if os.name == "nt" and os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            logger.error("status=error, action=config_cache_save, path=%s, error_msg=%s", self.path, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
@@ -0,0 +1,187 @@
+"""
+Datapoints are kept as `(metric, value, timestamp, dimensions)` tuples where
+`dimensions` is interned so that every datapoint of a time series shares one
+`Dimensions` object, along with its encoding.  Memory and encoding time then
+grow with the number of distinct time series rather than with the number of
+events.
+"""
+from __future__ import absolute_import
+
+import json
+import math
+
+from splunklib import six
+
+# The JSON framing around a single datapoint other than its metric name,
+# value and dimensions.
+DATAPOINT_JSON_OVERHEAD = len('{"metric":"","value":,"timestamp":1600000000000,"dimensions":},')
+
+
+def _gauge_value(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+# The field prefixes that mark a metric, in the order the metric types are
+# added to a payload, with how their values are converted.
+METRIC_FIELD_PREFIXES = (
+    ("gauge", "gauge_", _gauge_value),
+    ("counter", "counter_", int),
+    ("cumulative_counter", "cumulative_counter_", int),
+)
+
+
+class FieldPlan(object):
+    """
+    How each field of a header becomes part of a datapoint, worked out once
+    per header rather than for every field of every event.  Each field is a
+    metric, the timestamp, a dimension with its sanitized name, or ignored.
+    """
+
+    _compiled = {}
+
+    def __init__(self, fieldnames):
+        self.fieldnames = fieldnames
+        self.metrics = [(metric_type, convert, []) for metric_type, _, convert in METRIC_FIELD_PREFIXES]
+        self.dimensions = []
+        self.time_index = None
+
+        for index, key in enumerate(fieldnames):
+            for (_, prefix, _), (_, _, fields) in zip(METRIC_FIELD_PREFIXES, self.metrics):
+                if key.startswith(prefix):
+                    fields.append((index, key[len(prefix) :]))
+                    break
+            else:
+                if key == "_time":
+                    self.time_index = index
+                elif not key.startswith("_") and key != "punct" and not key.startswith("date_"):
+                    self.dimensions.append((index, key.replace(".", "_")))
+
+        self.metrics = [metric for metric in self.metrics if metric[2]]
+
+    @classmethod
+    def compile(cls, fieldnames):
+        """
+        Returns the plan for a tuple of field names, compiling it the first
+        time the header is seen.
+        """
+        plan = cls._compiled.get(fieldnames)
+        if plan is None:
+            plan = cls._compiled[fieldnames] = cls(fieldnames)
+        return plan
+
+    def apply(self, values):
+        """
+        Returns the timestamp, the `(key, value)` pairs of the dimensions and
+        a list of each metric type present with its `(metric, value)` pairs
+        for a row of `values` in header order.
+        """
+        metrics = []
+        for metric_type, convert, fields in self.metrics:
+            converted = [(name, convert(values[index])) for index, name in fields if values[index] != ""]
+            if converted:
+                metrics.append((metric_type, converted))
+        if not metrics:
+            return None, None, metrics
+
+        timestamp = None
+        if self.time_index is not None and values[self.time_index] != "":
+            timestamp = int(float(values[self.time_index]) * 1000)
+
+        dimensions = []
+        for index, name in self.dimensions:
+            value = values[index]
+            if value != "" and value[0] != "_" and len(value) < 256:
+                dimensions.append((name, value))
+
+        return timestamp, dimensions, metrics
+
+
+class Dimensions(dict):
+    """
+    An interned set of dimensions.  Its JSON encoding is computed once when
+    it is interned and its protobuf encoding the first time it is needed.
+    """
+
+    __slots__ = ("json", "protobuf")
+
+
+class DimensionCache(object):
+    """
+    Interns dimension sets given as a sequence of `(key, value)` pairs.  The
+    cache is cleared once it holds `max_size` sets so that a search with
+    unbounded cardinality doesn't grow it without limit.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._interned = {}
+
+    def __len__(self):
+        return len(self._interned)
+
+    def intern(self, items):
+        key = tuple(items)
+        try:
+            dimensions = self._interned.get(key)
+        except TypeError:
+            # Multivalue fields come as lists, which are sent as JSON arrays
+            key = tuple((name, tuple(value) if isinstance(value, list) else value) for name, value in key)
+            dimensions = self._interned.get(key)
+        if dimensions is None:
+            if len(self._interned) >= self.max_size:
+                self._interned.clear()
+            dimensions = Dimensions(key)
+            dimensions.json = json.dumps(dimensions, separators=(",", ":"))
+            dimensions.protobuf = None
+            self._interned[key] = dimensions
+        return dimensions
+
+
+def _encode_value(value):
+    if isinstance(value, float) and not (math.isinf(value) or math.isnan(value)):
+        return repr(value)
+    if isinstance(value, six.integer_types):
+        return str(value)
+    return json.dumps(value)
+
+
+def iter_json(payload):
+    """
+    Yields the JSON body for /v2/datapoint of a payload mapping each metric
+    type to its datapoints in fragments, splicing in the precomputed JSON of
+    each datapoint's dimensions.
+    """
+    metric_json = {}
+    separator = "{"
+    for metric_type, datapoints in six.iteritems(payload):
+        yield "%s%s:[" % (separator, json.dumps(metric_type))
+        separator = ""
+        for metric, value, timestamp, dimensions in datapoints:
+            name = metric_json.get(metric)
+            if name is None:
+                name = metric_json[metric] = json.dumps(metric)
+            if timestamp:
+                yield '%s{"metric":%s,"value":%s,"timestamp":%d,"dimensions":%s}' % (
+                    separator,
+                    name,
+                    _encode_value(value),
+                    timestamp,
+                    dimensions.json,
+                )
+            else:
+                yield '%s{"metric":%s,"value":%s,"dimensions":%s}' % (
+                    separator,
+                    name,
+                    _encode_value(value),
+                    dimensions.json,
+                )
+            separator = ","
+        separator = "],"
+    yield "]}" if separator == "]," else "{}"
+
+
+def encode_json(payload):
+    return "".join(iter_json(payload)).encode("utf-8")
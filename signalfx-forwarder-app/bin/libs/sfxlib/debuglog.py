@@ -0,0 +1,113 @@
+"""
+Debug logging of individual events that is cheap enough to leave in the
+path every event takes.  Nothing is logged unless it is started, and then
+only one in every `sample_every` events is logged, at no more than
+`max_per_second`.  On Python 3 records are written to the log files from a
+background thread so that the search command never waits on file I/O.
+"""
+from __future__ import absolute_import
+
+import logging
+import time
+
+from splunklib.six.moves import queue
+
+from .ratelimit import TokenBucket
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    # Python 2 doesn't have them, so records are written as they are logged
+    QueueHandler = QueueListener = None
+
+DEFAULT_SAMPLE_EVERY = 100
+
+DEFAULT_MAX_PER_SECOND = 10
+
+
+def effective_handlers(logger):
+    """
+    Returns the handlers that records logged to `logger` end up at.
+    """
+    handlers = []
+    while logger is not None:
+        handlers.extend(logger.handlers)
+        if not logger.propagate:
+            break
+        logger = logger.parent
+    return handlers
+
+
+class SampledLog(object):
+    """
+    Logs a sample of events to `logger` at DEBUG once started, starting with
+    the first, and counts the events `seen`, `logged` and `dropped` by the
+    rate limit.
+    """
+
+    def __init__(
+        self, logger, sample_every=DEFAULT_SAMPLE_EVERY, max_per_second=DEFAULT_MAX_PER_SECOND, clock=time.time
+    ):
+        self.logger = logger
+        self.sample_every = sample_every
+        self.enabled = False
+        self.seen = 0
+        self.logged = 0
+        self.dropped = 0
+        self._bucket = TokenBucket(max_per_second, clock=clock)
+        self._listener = None
+        self._saved = None
+
+    def start(self):
+        """
+        Enables logging, moving the handlers the logger writes to behind a
+        queue when possible.
+        """
+        logger = self.logger
+        self._saved = logger.level, logger.handlers[:], logger.propagate
+        logger.setLevel(logging.DEBUG)
+        if QueueListener is not None:
+            records = queue.Queue()
+            self._listener = QueueListener(records, *effective_handlers(logger), respect_handler_level=True)
+            logger.handlers = [QueueHandler(records)]
+            logger.propagate = False
+            self._listener.start()
+        self.enabled = True
+
+    def stop(self):
+        """
+        Logs the counts, waits for queued records to be written and puts the
+        logger back the way it was.
+        """
+        if not self.enabled:
+            return
+        self.logger.debug(
+            "action=debug_log_summary, seen=%d, logged=%d, dropped=%d", self.seen, self.logged, self.dropped
+        )
+        self.enabled = False
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        level, handlers, propagate = self._saved
+        self.logger.setLevel(level)
+        self.logger.handlers = handlers
+        self.logger.propagate = propagate
+
+    def sample(self):
+        """
+        Returns whether to log the current event.
+        """
+        if not self.enabled:
+            return False
+        self.seen += 1
+        if (self.seen - 1) % self.sample_every:
+            return False
+        if not self._bucket.take():
+            self.dropped += 1
+            return False
+        self.logged += 1
+        return True
+
+    def debug(self, msg, *args):
+        if self.sample():
+            self.logger.debug(msg, *args)
@@ -0,0 +1,284 @@
+"""
+The part of the SignalFx forwarder search commands that doesn't depend on
+what they send: looking up the ingest URL and access token, sending batches
+with retries and a spool, handing results back to Splunk as batches are sent
+and reporting the time spent in each stage to the job inspector.
+"""
+from __future__ import absolute_import
+
+import os
+from collections import deque
+
+from splunklib.searchcommands import Option, SearchMetric, validators
+
+from .compression import COMPRESSIONS, DEFAULT_LEVEL
+from .config_cache import DEFAULT_TTL, ConfigCache, file_fingerprint
+from .metrics import StageMetrics, clock
+from .retry import RetryPolicy, Spool
+from .sender import OUTPUT_MODES, BatchSender
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+# The app is installed in $SPLUNK_HOME/etc/apps, which splunkd sets SPLUNK_HOME to for search commands
+SPLUNK_HOME = os.environ.get("SPLUNK_HOME") or os.path.dirname(os.path.dirname(os.path.dirname(APP_DIR)))
+# Spooled requests can add up during an outage, so they are kept with Splunk's data rather than in the app
+SPOOL_DIR = os.path.join(SPLUNK_HOME, "var", "lib", "splunk", "signalfx-forwarder-app", "spool")
+CONFIG_CACHE_PATH = os.path.join(APP_DIR, "local", "cache", "config.json")
+# Updated by splunkd whenever the access token is saved from the configuration page
+PASSWORDS_CONF_PATH = os.path.join(APP_DIR, "local", "passwords.conf")
+
+
+class Forwarder(object):
+    """
+    Sends what is built from search results to SignalFx in batches, handing
+    each result back once the batch it is part of has been sent.  Mixed into
+    the search commands, which start and fill batches with `new_batch`,
+    `batch_full` and `submit_batch`, and send them with `send`.  Batches are
+    spooled under `spool_name` when they can't be sent.
+    """
+
+    spool_name = None
+    size_name = "datapoints"
+    access_token = None
+    _config_cache = None
+    _retry_policy = None
+    _spool = None
+    _batch = None
+    _in_flight = None
+    _sender = None
+    _rate_limiter = None
+    _metrics = None
+    _stage_seconds = None
+    _batch_count = 0
+    debug = Option(validate=validators.Boolean(), default=False)
+    dry_run = Option(validate=validators.Boolean(), default=False)
+    ingest_url = Option(validate=validators.Match("https://.*", r"^https://.*"))
+    max_attempts = Option(validate=validators.Integer(minimum=1), default=3)
+    spool = Option(validate=validators.Boolean(), default=True)
+    replay_spool = Option(validate=validators.Boolean(), default=False)
+    config_cache_ttl = Option(validate=validators.Integer(minimum=0), default=DEFAULT_TTL)
+    concurrency = Option(validate=validators.Integer(minimum=1), default=1)
+    compression = Option(validate=validators.Set(*COMPRESSIONS), default="gzip")
+    compression_level = Option(validate=validators.Integer(minimum=1, maximum=9), default=DEFAULT_LEVEL)
+    output = Option(validate=validators.Set(*OUTPUT_MODES), default="all")
+
+    SPLUNK_PASSWORD_REALM = "realm"
+    SPLUNK_PASSWORD_USER_NAME = "username"
+    SPLUNK_PASSWORD_CLEAR_PASSWORD = "clear_password"
+    SPLUNK_KV_STORE_SFX_CONFIG_COLLECTION_NAME = "sfx_ingest_config"
+    SPLUNK_SFX_CONFIG_INGEST_URL_KEY = "ingest_url"
+    SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_REALM = "sfx_ingest_command"
+    SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_USER_NAME = "access_token"
+
+    @property
+    def endpoint(self):
+        """
+        The path of the ingest API the batches are sent to
+        """
+        raise NotImplementedError()
+
+    def ensure_default_config(self):
+        self._config_cache = ConfigCache(
+            CONFIG_CACHE_PATH, ttl=self.config_cache_ttl, fingerprint=file_fingerprint(PASSWORDS_CONF_PATH)
+        )
+        if not self.ingest_url:
+            # Saved to the KV store, which has no file to fingerprint, so the cache couldn't tell when it changes
+            self.ingest_url = self.get_sfx_ingest_url()
+
+        self.logger.error("getting access token")
+        self.access_token = self._config_cache.get("access_token", self.get_access_token)
+
+    def get_access_token(self):
+        try:
+            name = "{}:{}:".format(
+                self.SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_REALM,
+                self.SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_USER_NAME,
+            )
+            try:
+                credential = self.service.storage_passwords[name]
+            except KeyError:
+                return None
+            except ValueError:
+                # The credential is visible from more than one namespace, so
+                # fall back to looking through all of them
+                credential = next(
+                    (
+                        credential
+                        for credential in self.service.storage_passwords
+                        if credential.content.get(self.SPLUNK_PASSWORD_REALM, None)
+                        == self.SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_REALM
+                        and credential.content.get(self.SPLUNK_PASSWORD_USER_NAME, None)
+                        == self.SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_USER_NAME
+                    ),
+                    None,
+                )
+                if credential is None:
+                    return None
+            return credential.content.get(self.SPLUNK_PASSWORD_CLEAR_PASSWORD, None)
+        except Exception as e:  # pylint:disable=broad-except
+            self.logger.error("status=error, action=get_sfx_access_token, error_msg=%s", e, exc_info=True)
+        return None
+
+    def get_sfx_ingest_url(self):
+        try:
+            try:
+                collection = self.service.kvstore[self.SPLUNK_KV_STORE_SFX_CONFIG_COLLECTION_NAME]
+            except KeyError:
+                return None
+            # There should only be one setting, but grab the most recent one
+            # in case there are more.  Keys are generated in insertion order.
+            sfx_ingest_config_records = collection.data.query(sort="_key:-1", limit=1)
+            if sfx_ingest_config_records:
+                return sfx_ingest_config_records[0].get(self.SPLUNK_SFX_CONFIG_INGEST_URL_KEY, None)
+        except Exception as e:  # pylint:disable=broad-except
+            self.logger.error("status=error, action=get_sfx_ingest_url, error_msg=%s", str(e), exc_info=True)
+        return None
+
+    def new_rate_limiter(self):
+        """
+        Returns the `RateLimiter` batches are sent under, if any
+        """
+        return None
+
+    def forward(self, records):
+        """
+        Sends what is built from `records` and yields the results for each
+        sent batch as described by `batch_results`.
+        """
+        self.ensure_default_config()
+
+        self._in_flight = deque()
+        self._batch_count = 0
+        self._metrics = StageMetrics()
+        # Seconds spent reading records and building batches from them since the last report, and the part of the
+        # time reading records that was spent in flush
+        self._stage_seconds = stage_seconds = [0.0, 0.0, 0.0]
+        self._batch = self.new_batch()
+        if not self.dry_run:
+            self._retry_policy = RetryPolicy(max_attempts=self.max_attempts)
+            self._spool = Spool(os.path.join(SPOOL_DIR, self.spool_name)) if self.spool else None
+            self._rate_limiter = self.new_rate_limiter()
+            self._sender = BatchSender(self.post_payload, concurrency=self.concurrency, rate_limiter=self._rate_limiter)
+
+        try:
+            if self._sender is not None and self.replay_spool:
+                self.replay(self._sender.session)
+
+            ready = clock()
+            for event in records:
+                received = clock()
+                stage_seconds[0] += received - ready
+                self._batch.add(event)
+
+                if self.debug:
+                    event["endpoint"] = self.ingest_url + self.endpoint
+
+                ready = clock()
+                stage_seconds[1] += ready - received
+
+                if self.batch_full():
+                    self.submit_batch()
+                    for sent in self.sent_events():
+                        yield sent
+                    ready = clock()
+
+            self.submit_batch(final=True)
+            for sent in self.sent_events(wait=True):
+                yield sent
+        finally:
+            if self._sender is not None:
+                self._sender.close()
+            if self._rate_limiter is not None:
+                waited = round(self._rate_limiter.waited, 3)
+                self.write_metric("rate_limit_wait_seconds", SearchMetric(waited, None, None, None))
+            self.report_metrics()
+
+    def flush(self):
+        # splunklib flushes once every record of a chunk has been read and before it waits on the next chunk, so
+        # submit whatever is left of the chunk here and hand back the records of every batch sent so far.
+        if self._batch is not None:
+            start = clock()
+            self.submit_batch()
+            self._record_writer.write_records(self.sent_events())
+            self._metrics.add("output_seconds", clock() - start)
+            self.report_metrics()
+            self._stage_seconds[2] = clock() - start
+        super(Forwarder, self).flush()
+
+    def report_metrics(self):
+        """
+        Writes the running totals of each stage to the job inspector along
+        with their change since the last chunk: the seconds spent in the
+        stage, how many times it ran and what went in and out of it.
+        """
+        parse_seconds, build_seconds, flush_seconds = self._stage_seconds
+        self._stage_seconds[:] = [0.0, 0.0, 0.0]
+        self._metrics.add("parse_seconds", parse_seconds - flush_seconds)
+        self._metrics.add("build_seconds", build_seconds)
+        self._metrics.report(
+            self.write_metric,
+            [
+                ("parse", "parse_seconds", None, None, "rows"),
+                ("build", "build_seconds", None, "rows", self.size_name),
+                ("encode", "encode_seconds", None, self.size_name, "bytes_raw"),
+                ("gzip", "gzip_seconds", None, "bytes_raw", "bytes_compressed"),
+                ("http", "http_seconds", "requests", "bytes_compressed", None),
+                ("retry", None, "retries", None, None),
+                ("spool", None, "spooled", None, None),
+                ("output", "output_seconds", None, None, None),
+            ],
+        )
+
+    def new_batch(self):
+        raise NotImplementedError()
+
+    def batch_full(self):
+        raise NotImplementedError()
+
+    def submit_batch(self, final=False):
+        """
+        Sends the current batch and starts a new one unless this is the
+        `final` batch.
+        """
+        raise NotImplementedError()
+
+    def sent_events(self, wait=False):
+        """
+        Yields the results of sent batches in the order they were submitted.
+        Only waits on a batch still in flight if `wait` is set or if more than
+        `concurrency` batches are outstanding.
+        """
+        while self._in_flight:
+            pending = self._in_flight[0]
+            if not (wait or pending.done() or len(self._in_flight) > self.concurrency):
+                return
+            pending.wait()
+            self._in_flight.popleft()
+            for result in self.batch_results(pending):
+                yield result
+
+    def batch_results(self, pending):
+        """
+        Returns the results to hand back to Splunk for a sent batch: its
+        events marked with the send status, a summary row or only the events
+        of a failed batch, depending on `output`.
+        """
+        self._batch_count += 1
+        return pending.results(self.output, self._batch_count, size_name=self.size_name)
+
+    def send(self, session, payload):
+        """
+        Sends a payload built by `submit_batch` and returns the response
+        """
+        raise NotImplementedError()
+
+    def post_payload(self, session, payload):
+        response = self.send(session, payload)
+        if response.status_code in (401, 403):
+            # The cached access token may have been revoked or replaced
+            self._config_cache.invalidate()
+        return response
+
+    def replay(self, session):
+        spool = Spool(os.path.join(SPOOL_DIR, self.spool_name))
+        replayed, remaining = spool.replay(session, self.access_token, self._retry_policy)
+        self.write_info("Replayed {} spooled requests, {} left in the spool", replayed, remaining)
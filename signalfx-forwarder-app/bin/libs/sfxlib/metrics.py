@@ -0,0 +1,89 @@
+"""
+Times each stage of forwarding search results and counts what went through
+it so that the search commands can report where the time of a search goes
+in the job inspector.
+"""
+from __future__ import absolute_import
+
+import threading
+import time
+
+from splunklib.searchcommands import SearchMetric
+
+# time.perf_counter is Python 3 only
+clock = getattr(time, "perf_counter", time.time)  # pylint: disable=invalid-name
+
+
+class Measured(object):
+    """
+    Wraps an iterable of str or bytes, adding up the time spent producing
+    its items in `seconds` and their length in `size`.
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.seconds = 0.0
+        self.size = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = clock()
+        try:
+            item = next(self._iterator)
+        finally:
+            self.seconds += clock() - start
+        self.size += len(item)
+        return item
+
+    next = __next__
+
+
+class StageMetrics(object):
+    """
+    Running totals of stage timings, in seconds, and of volumes such as rows
+    and bytes.  Totals are updated from the sender threads as well as the
+    search command, so updates are serialized.
+    """
+
+    def __init__(self):
+        self._totals = {}
+        self._reported = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, value):
+        with self._lock:
+            self._totals[name] = self._totals.get(name, 0) + value
+
+    def get(self, name):
+        with self._lock:
+            return self._totals.get(name, 0)
+
+    def report(self, write_metric, stages):
+        """
+        Writes a `SearchMetric` for each of `stages` with
+        `write_metric(name, metric)` along with how much it changed since the
+        last report as `chunk.<name>`.  Stages are given as `(name, seconds,
+        invocations, inputs, outputs)`, each but the name being the name of
+        the total that goes in that part of the metric, or None.
+        """
+        with self._lock:
+            totals = dict(self._totals)
+        for stage in stages:
+            name, fields = stage[0], stage[1:]
+            write_metric(name, self._metric(fields, totals))
+            write_metric("chunk." + name, self._metric(fields, totals, self._reported))
+        self._reported = totals
+
+    @staticmethod
+    def _metric(fields, totals, reported=None):
+        values = []
+        for field in fields:
+            value = None
+            if field is not None:
+                value = totals.get(field, 0) - (reported or {}).get(field, 0)
+                if isinstance(value, float):
+                    value = round(value, 6)
+            values.append(value)
+        return SearchMetric(*values)
@@ -0,0 +1,155 @@
+"""
+A pure Python encoder for the SignalFx protocol buffer datapoint format
+accepted by /v2/datapoint with a `Content-Type` of `application/x-protobuf`.
+
+Only the messages needed to upload datapoints are implemented:
+
+    message Datum {
+        optional string strValue = 1;
+        optional double doubleValue = 2;
+        optional int64 intValue = 3;
+    }
+    message Dimension {
+        optional string key = 1;
+        optional string value = 2;
+    }
+    message DataPoint {
+        optional string source = 1;
+        optional string metric = 2;
+        optional int64 timestamp = 3;
+        optional Datum value = 4;
+        optional MetricType metricType = 5;
+        repeated Dimension dimensions = 6;
+    }
+    message DataPointUploadMessage {
+        repeated DataPoint datapoints = 1;
+    }
+"""
+from __future__ import absolute_import
+
+import struct
+
+from splunklib import six
+
+CONTENT_TYPE = "application/x-protobuf"
+
+METRIC_TYPES = {"gauge": 0, "counter": 1, "enum": 2, "cumulative_counter": 3}
+
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+
+_INT64_MIN = -(2 ** 63)
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _key(field_number, wire_type):
+    return six.int2byte((field_number << 3) | wire_type)
+
+
+def encode_varint(value):
+    """
+    Encodes an int64 as a base 128 varint, negative values taking the full
+    ten bytes of their 64 bit two's complement.
+    """
+    if 0 <= value <= 0x7F:
+        return _SMALL_VARINTS[value]
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+_SMALL_VARINTS = [six.int2byte(i) for i in range(0x80)]
+
+
+def _length_delimited(field_number, data):
+    return _key(field_number, _LENGTH_DELIMITED) + encode_varint(len(data)) + data
+
+
+def _string(field_number, value):
+    if not isinstance(value, bytes):
+        value = value.encode("utf-8")
+    return _length_delimited(field_number, value)
+
+
+_INT_DATUM_KEY = _key(3, _VARINT)
+_DOUBLE_DATUM_KEY = _key(2, _FIXED64)
+_pack_double = struct.Struct("<d").pack
+
+
+def encode_datum(value):
+    if isinstance(value, six.integer_types) and _INT64_MIN <= value <= _INT64_MAX:
+        return _INT_DATUM_KEY + encode_varint(value)
+    return _DOUBLE_DATUM_KEY + _pack_double(value)
+
+
+def _dimension_value(value):
+    # Protobuf dimension values are strings, so multivalue fields are joined
+    if isinstance(value, six.string_types):
+        return value
+    return ",".join(value)
+
+
+def encode_dimensions(dimensions):
+    return b"".join(
+        _length_delimited(6, _string(1, key) + _string(2, _dimension_value(value)))
+        for key, value in six.iteritems(dimensions)
+    )
+
+
+_TIMESTAMP_KEY = _key(3, _VARINT)
+_VALUE_KEY = _key(4, _LENGTH_DELIMITED)
+_METRIC_TYPE_FIELDS = dict((name, _key(5, _VARINT) + encode_varint(value)) for name, value in METRIC_TYPES.items())
+
+
+def encode_datapoint(metric_type, metric, value, timestamp, dimensions):
+    """
+    Encodes a single datapoint where `metric` and `dimensions` are already
+    encoded as their DataPoint fields.
+    """
+    datum = encode_datum(value)
+    return b"".join(
+        (
+            metric,
+            _TIMESTAMP_KEY + encode_varint(timestamp) if timestamp else b"",
+            _VALUE_KEY,
+            _SMALL_VARINTS[len(datum)],
+            datum,
+            _METRIC_TYPE_FIELDS[metric_type],
+            dimensions,
+        )
+    )
+
+
+_DATAPOINT_KEY = _key(1, _LENGTH_DELIMITED)
+
+
+def iter_datapoints(payload):
+    """
+    Yields a payload mapping each metric type to its datapoints as a
+    DataPointUploadMessage, one encoded datapoint at a time.  Each metric
+    name is encoded once, and the encoding of interned dimensions is kept on
+    them for later payloads.
+    """
+    encoded_metrics = {}
+    for metric_type, datapoints in six.iteritems(payload):
+        for metric, value, timestamp, dimensions in datapoints:
+            dimensions_field = getattr(dimensions, "protobuf", None)
+            if dimensions_field is None:
+                dimensions_field = encode_dimensions(dimensions)
+                if hasattr(dimensions, "protobuf"):
+                    dimensions.protobuf = dimensions_field
+            metric_field = encoded_metrics.get(metric)
+            if metric_field is None:
+                metric_field = encoded_metrics[metric] = _string(2, metric)
+            encoded = encode_datapoint(metric_type, metric_field, value, timestamp, dimensions_field)
+            yield _DATAPOINT_KEY + encode_varint(len(encoded)) + encoded
+
+
+def encode_datapoints(payload):
+    return b"".join(iter_datapoints(payload))
@@ -0,0 +1,89 @@
+"""
+Paces requests to SignalFx ingest so that a large search doesn't trip the
+org's ingest throttling for every other producer.  Batches are delayed
+rather than dropped.
+"""
+from __future__ import absolute_import, division
+
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    Refills at `rate` tokens per second up to `capacity`.  Taking more tokens
+    than the bucket holds leaves it in debt, and the caller waits until the
+    debt would have been refilled, so a large batch is paced by its size
+    rather than rejected.  Safe to share between threads.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.time):
+        self.rate = float(rate)
+        self.capacity = self.rate if capacity is None else capacity
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens):
+        """
+        Takes `tokens` from the bucket and returns how many seconds the
+        caller must wait before using them.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def take(self, tokens=1):
+        """
+        Takes `tokens` from the bucket only if it holds them, returning
+        whether it did, for callers that drop rather than wait.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter(object):
+    """
+    Limits the datapoints sent per minute and the requests sent per second,
+    either of which may be None for no limit.  `waited` is the total time
+    spent waiting, in seconds.
+    """
+
+    def __init__(self, max_dpm=None, max_requests_per_sec=None, clock=time.time, sleep=time.sleep):
+        if max_dpm:
+            self._datapoints = TokenBucket(max_dpm / 60, clock=clock)
+        else:
+            self._datapoints = None
+        if max_requests_per_sec:
+            self._requests = TokenBucket(max_requests_per_sec, clock=clock)
+        else:
+            self._requests = None
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def wait(self, datapoints):
+        """
+        Blocks until a request carrying `datapoints` can be sent.
+        """
+        delay = 0.0
+        if self._datapoints is not None:
+            delay = self._datapoints.reserve(datapoints)
+        if self._requests is not None:
+            delay = max(delay, self._requests.reserve(1))
+        if delay > 0:
+            self._sleep(delay)
+            with self._lock:
+                self.waited += delay
+        return delay
@@ -0,0 +1,249 @@
+"""
+Retries requests to SignalFx ingest that fail with a transient error and
+spools the ones that still fail to disk so that a later search can replay
+them instead of the search having to be run again.
+"""
+from __future__ import absolute_import, division
+
+import calendar
+import itertools
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from email.utils import parsedate_tz
+
+import requests
+
+from .metrics import clock
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+RETRYABLE_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+# The access token is looked up again when a spooled request is replayed
+# rather than being written to disk.
+TOKEN_HEADER = "X-SF-TOKEN"
+
+
+class RetryPolicy(object):
+    """
+    Exponential backoff with full jitter between attempts.  A `Retry-After`
+    header on the response is used instead of the backoff, unless it asks for
+    a longer wait than `max_delay`, in which case the request is not retried.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, response=None):
+        """
+        Returns the seconds to wait before retrying after the zero-based
+        `attempt` failed, or None if the request shouldn't be retried.
+        """
+        if attempt + 1 >= self.max_attempts:
+            return None
+        retry_after = parse_retry_after(response)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def parse_retry_after(response):
+    """
+    Returns the seconds to wait from a `Retry-After` header given either as
+    a number of seconds or as an HTTP date, or None if there is no usable one.
+    """
+    value = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    offset = parsed[9] or 0
+    return max(0.0, calendar.timegm(parsed[:9]) - offset - time.time())
+
+
+def is_retryable(response):
+    return response.status_code in RETRYABLE_STATUS_CODES
+
+
+def post_with_retry(
+    session, url, headers, body, policy, spool=None, sleep=time.sleep, metrics=None
+):  # pylint: disable=too-many-arguments
+    """
+    Posts `body` until it is accepted, fails with a non-retryable status or
+    `policy` gives up.  If it never succeeded the request is written to
+    `spool`, if given.  Returns the last response, or re-raises the last
+    connection error if no response was ever received.  Round-trip times
+    and the number of requests, retries and spooled requests are added to
+    `metrics`, if given.
+    """
+    attempt = 0
+    while True:
+        response, error = None, None
+        start = clock()
+        try:
+            response = session.post(url, headers=headers, data=body)
+            if not is_retryable(response):
+                return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+        finally:
+            if metrics is not None:
+                metrics.add("http_seconds", clock() - start)
+                metrics.add("requests", 1)
+
+        delay = policy.delay(attempt, response)
+        if delay is None:
+            break
+        logger.warning(
+            "status=retrying, action=post_with_retry, attempt=%d, delay=%.2f, status_code=%s, error_msg=%s",
+            attempt + 1,
+            delay,
+            getattr(response, "status_code", None),
+            error,
+        )
+        sleep(delay)
+        attempt += 1
+        if metrics is not None:
+            metrics.add("retries", 1)
+
+    if spool is not None:
+        spool.write(url, headers, body)
+        if metrics is not None:
+            metrics.add("spooled", 1)
+    if response is None:
+        raise error  # pylint: disable=raising-bad-type
+    return response
+
+
+class Spool(object):
+    """
+    A directory of requests that could not be delivered.  Each request is
+    kept in its own file as a line of JSON with the url and headers followed
+    by the already encoded body.  Requests older than `max_age` seconds are
+    dropped, as are the oldest ones once the spool holds more than
+    `max_bytes`, so that an outage can't fill the disk.
+    """
+
+    SUFFIX = ".spool"
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    DEFAULT_MAX_AGE = 24 * 60 * 60
+
+    # Orders requests spooled within the same millisecond by this process
+    _sequence = itertools.count()
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def write(self, url, headers, body):
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory, 0o700)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+
+        name = "%d-%08d-%s" % (int(time.time() * 1000), next(self._sequence), uuid.uuid4().hex)
+        path = os.path.join(self.directory, name + self.SUFFIX)
+        tmp_path = os.path.join(self.directory, name + ".tmp")
+        meta = {"url": url, "headers": dict((k, v) for k, v in headers.items() if k != TOKEN_HEADER)}
+
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as spooled:
+            spooled.write(json.dumps(meta).encode("utf-8") + b"\n")
+            spooled.write(body)
+        os.rename(tmp_path, path)
+        logger.error("status=spooled, action=spool_write, url=%s, path=%s", url, path)
+        self.trim()
+        return path
+
+    def trim(self):
+        """
+        Removes the requests older than `max_age`, then the oldest requests
+        until the spool holds no more than `max_bytes`.  Returns the number
+        of requests removed.
+        """
+        spooled = []
+        for path in self.paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Replayed or trimmed by another search in the meantime
+                continue
+            spooled.append((path, stat.st_mtime, stat.st_size))
+
+        now = time.time()
+        total = sum(size for _, _, size in spooled)
+        dropped = 0
+        # Oldest first since names start with the time they were spooled
+        for path, mtime, size in spooled:
+            expired = now - mtime > self.max_age
+            if not expired and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            dropped += 1
+            logger.error(
+                "status=dropped, action=spool_trim, path=%s, reason=%s", path, "max_age" if expired else "max_bytes"
+            )
+        return dropped
+
+    def paths(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(self.SUFFIX)
+        )
+
+    @staticmethod
+    def read(path):
+        with open(path, "rb") as spooled:
+            meta = json.loads(spooled.readline().decode("utf-8"))
+            return meta["url"], meta["headers"], spooled.read()
+
+    def replay(self, session, token, policy):
+        """
+        Re-sends every spooled request oldest first, once the spool has been
+        trimmed, removing the ones that were accepted or rejected outright.  Requests that fail again with a
+        transient error are left in the spool.  Returns the number of
+        requests replayed and the number left.
+        """
+        self.trim()
+        replayed, remaining = 0, 0
+        for path in self.paths():
+            url, headers, body = self.read(path)
+            headers[TOKEN_HEADER] = token
+            try:
+                response = post_with_retry(session, url, headers, body, policy)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                logger.error("status=error, action=spool_replay, path=%s, error_msg=%s", path, e)
+                remaining += 1
+                continue
+            if is_retryable(response):
+                remaining += 1
+                continue
+            if response.status_code != 200:
+                logger.error(
+                    "status=dropped, action=spool_replay, path=%s, status_code=%d, response=%s",
+                    path,
+                    response.status_code,
+                    response.content,
+                )
+            os.remove(path)
+            replayed += 1
+        return replayed, remaining
@@ -0,0 +1,135 @@
+"""
+Aggregates the datapoints of each time series that fall into the same time
+bucket so that a single datapoint is sent for the series and bucket rather
+than one for every event.  Counters are summed and cumulative counters keep
+their latest value.  Gauges keep their latest, average, minimum or maximum
+value.
+"""
+from __future__ import absolute_import, division
+
+from collections import OrderedDict, deque
+
+from .datapoints import DATAPOINT_JSON_OVERHEAD, METRIC_FIELD_PREFIXES
+
+GAUGE_AGGREGATIONS = ("last", "avg", "min", "max")
+
+
+def _latest(entry, value, timestamp):
+    # Search results usually arrive latest first, so an equal timestamp
+    # doesn't replace the value already kept
+    if timestamp is not None and (entry[2] is None or timestamp > entry[2]):
+        entry[0] = value
+        entry[2] = timestamp
+
+
+def _sum(entry, value, _):
+    entry[0] += value
+
+
+def _minimum(entry, value, _):
+    if value < entry[0]:
+        entry[0] = value
+
+
+def _maximum(entry, value, _):
+    if value > entry[0]:
+        entry[0] = value
+
+
+_GAUGE_MERGES = {"last": _latest, "avg": _sum, "min": _minimum, "max": _maximum}
+
+
+class Rollup(object):
+    """
+    A table of aggregated datapoints keyed by metric type, metric name,
+    dimensions and time bucket.  `interval` is the bucket width in
+    milliseconds.  Datapoints without a timestamp are aggregated together.
+    """
+
+    def __init__(self, interval, gauge="last"):
+        if gauge not in _GAUGE_MERGES:
+            raise ValueError("Unknown gauge aggregation: {}".format(gauge))
+        self.interval = interval
+        self.gauge = gauge
+        self.size = 0
+        self._merges = {"gauge": _GAUGE_MERGES[gauge], "counter": _sum, "cumulative_counter": _latest}
+        self._table = {}
+        self._open_bucket = None
+
+    def __len__(self):
+        return len(self._table)
+
+    def add(self, timestamp, dimensions, metrics):
+        """
+        Adds the datapoints classified from an event by
+        `FieldPlan.apply`, with its dimensions interned.  Returns the number
+        of datapoints added to the table and an estimate of their serialized
+        size; datapoints merged into an existing one count for nothing.
+        """
+        if not metrics:
+            return 0, 0
+
+        bucket = None if timestamp is None else timestamp - timestamp % self.interval
+        self._open_bucket = bucket
+        table = self._table
+        count, size = 0, 0
+        for metric_type, metric_list in metrics:
+            merge = self._merges[metric_type]
+            for metric, value in metric_list:
+                key = (metric_type, metric, dimensions.json, bucket)
+                entry = table.get(key)
+                if entry is None:
+                    table[key] = [value, 1, timestamp, dimensions]
+                    count += 1
+                    size += len(metric)
+                else:
+                    merge(entry, value, timestamp)
+                    entry[1] += 1
+        size += count * (DATAPOINT_JSON_OVERHEAD + len(dimensions.json))
+        self.size += size
+        return count, size
+
+    def split_open_bucket(self, max_datapoints=None, max_size=None):
+        """
+        Moves the aggregates of the bucket the last datapoints were added to
+        into a new table and returns it.  Events arrive in time order, so
+        that is the only bucket that can still get more datapoints, and
+        carrying it over keeps it from being sent twice with partial values
+        when the events are split into batches.  A bucket that alone holds
+        `max_datapoints` or `max_size` is left to be sent instead, since the
+        batch it was carried into would be full before it got any events.
+        """
+        rollup = Rollup(self.interval, gauge=self.gauge)
+        rollup._open_bucket = bucket = self._open_bucket  # pylint: disable=protected-access
+        keys = [key for key in self._table if key[3] == bucket]
+        sizes = [len(key[1]) + DATAPOINT_JSON_OVERHEAD + len(self._table[key][3].json) for key in keys]
+        if (max_datapoints is not None and len(keys) >= max_datapoints) or (
+            max_size is not None and sum(sizes) >= max_size
+        ):
+            return rollup
+        for key, size in zip(keys, sizes):
+            rollup._table[key] = self._table.pop(key)  # pylint: disable=protected-access
+            self.size -= size
+            rollup.size += size
+        return rollup
+
+    def payload(self):
+        """
+        Returns the aggregated datapoints as a payload in the same form as one
+        built by `add_event_to_payload`, oldest bucket first and stamped with
+        the start of their bucket.
+        """
+        average = self.gauge == "avg"
+        by_type = dict((metric_type, []) for metric_type, _, _ in METRIC_FIELD_PREFIXES)
+        for (metric_type, metric, _, bucket), (value, count, _, dimensions) in self._table.items():
+            if average and metric_type == "gauge":
+                value = value / count
+            by_type[metric_type].append((metric, value, bucket, dimensions))
+
+        payload = OrderedDict()
+        for metric_type, _, _ in METRIC_FIELD_PREFIXES:
+            datapoints = by_type[metric_type]
+            if datapoints:
+                datapoints.sort(key=lambda datapoint: datapoint[2] or 0)
+                payload[metric_type] = deque(datapoints)
+        return payload
@@ -0,0 +1,164 @@
+"""
+Sends batches to SignalFx ingest from a pool of worker threads so that the
+search command can keep reading and building batches while earlier ones are
+in flight.
+"""
+from __future__ import absolute_import
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from splunklib.six.moves import queue
+
+from .metrics import clock
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# What the search commands hand back to Splunk: every event, one summary row
+# per batch or only the events of failed batches
+OUTPUT_MODES = ("all", "summary", "errors")
+
+
+class PendingBatch(object):
+    """
+    A payload handed to a `BatchSender` along with the events it was built
+    from and the number of datapoints or events it holds.  `rows` is the
+    number of events when they aren't kept.  Once sent, the response status
+    is recorded on each of the events and `seconds` is how long the send took.
+    """
+
+    def __init__(self, payload, events, size=0, rows=None):
+        self.payload = payload
+        self.events = events
+        self.size = size
+        self.rows = len(events) if rows is None else rows
+        self.seconds = 0.0
+        self.response = None
+        self.error = None
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self):
+        self._done.wait()
+
+    def finish(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self._done.set()
+
+    def mark_events(self):
+        """
+        Sets `status` and `response_error` on each of the events, the error
+        being empty unless the batch failed.  Every event gets both fields
+        since Splunk takes the fields of a chunk from its first result.
+        Re-raises the error if the batch could not be sent at all.
+        """
+        if self.error is not None:
+            raise self.error  # pylint: disable=raising-bad-type
+        if self.response is None:
+            return
+        response_error = self.response.content if self.failed() else ""
+        for event in self.events:
+            event["status"] = self.response.status_code
+            event["response_error"] = response_error
+
+    def failed(self):
+        return self.response is not None and self.response.status_code != 200
+
+    def results(self, output, number, size_name="datapoints"):
+        """
+        Returns the results to hand back to Splunk for the batch according to
+        `output`, one of `OUTPUT_MODES`.  The summary row of the `number`th
+        batch has the `rows` it was built from, its size as `size_name`, the
+        `bytes` and `seconds` it took to send, its `status` and its
+        `response_error`.
+        """
+        if output != "summary":
+            if output == "errors" and not self.failed() and self.error is None:
+                return ()
+            self.mark_events()
+            return self.events
+
+        if self.error is not None:
+            raise self.error  # pylint: disable=raising-bad-type
+        summary = OrderedDict(
+            [
+                ("_time", time.time()),
+                ("batch", number),
+                ("rows", self.rows),
+                (size_name, self.size),
+                ("bytes", sent_bytes(self.response)),
+                ("seconds", round(self.seconds, 6)),
+            ]
+        )
+        if self.response is not None:
+            summary["status"] = self.response.status_code
+            summary["response_error"] = self.response.content if self.failed() else ""
+        return (summary,)
+
+
+def sent_bytes(response):
+    """
+    Returns the size of the request body that got `response`, or 0 if
+    nothing was sent.
+    """
+    body = getattr(getattr(response, "request", None), "body", None)
+    return len(body) if body else 0
+
+
+class BatchSender(object):
+    """
+    Calls `send(session, payload)` for each submitted batch on one of
+    `concurrency` worker threads sharing a keep-alive `requests.Session`.
+    Submitting blocks once `concurrency` batches are already waiting to be sent.
+    Batches wait on `rate_limiter`, if given, before they are sent.
+    """
+
+    def __init__(self, send, concurrency=1, rate_limiter=None):
+        self._send = send
+        self._rate_limiter = rate_limiter
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._queue = queue.Queue(maxsize=concurrency)
+        self._workers = []
+        for _ in range(concurrency):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, payload, events, size=0, rows=None):
+        batch = PendingBatch(payload, events, size, rows)
+        self._queue.put(batch)
+        return batch
+
+    def close(self):
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self.session.close()
+
+    def _work(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            try:
+                if self._rate_limiter is not None:
+                    self._rate_limiter.wait(batch.size)
+                start = clock()
+                response = self._send(self.session, batch.payload)
+                batch.seconds = clock() - start
+                batch.finish(response=response)
+            except Exception as e:  # pylint:disable=broad-except
+                logger.error("status=error, action=send_batch, error_msg=%s", e, exc_info=True)
+                batch.finish(error=e)
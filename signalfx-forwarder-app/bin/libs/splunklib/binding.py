@@ -26,11 +26,13 @@ If you want a friendlier interface to the Splunk REST API, use the
 
 from __future__ import absolute_import
 
+import errno
 import io
 import logging
 import socket
 import ssl
 import sys
+import threading
 from base64 import b64encode
 from contextlib import contextmanager
 from datetime import datetime
@@ -55,7 +57,8 @@ __all__ = [
     "connect",
     "Context",
     "handler",
-    "HTTPError"
+    "HTTPError",
+    "pooled_handler"
 ]
 
 # If you change these, update the docstring
@@ -1279,9 +1282,10 @@ class ResponseReader(io.RawIOBase):
     # For testing, you can use a StringIO as the argument to
     # ``ResponseReader`` instead of an ``httplib.HTTPResponse``. It
     # will work equally well.
-    def __init__(self, response, connection=None):
+    def __init__(self, response, connection=None, release=None):
         self._response = response
         self._connection = connection
+        self._release = release
         self._buffer = b''
 
     def __str__(self):
@@ -1307,8 +1311,11 @@ class ResponseReader(io.RawIOBase):
 
     def close(self):
         """Closes this response."""
-        if self._connection:
+        if self._release is not None and self._response.isclosed():
+            self._release_connection()
+        elif self._connection:
             self._connection.close()
+            self._connection = None
         self._response.close()
 
     def read(self, size = None):
@@ -1324,8 +1331,16 @@ class ResponseReader(io.RawIOBase):
         if size is not None:
             size -= len(r)
         r = r + self._response.read(size)
+        if self._release is not None and self._response.isclosed():
+            self._release_connection()
         return r
 
+    def _release_connection(self):
+        # The body has been drained, so the connection can carry another request
+        release, self._release = self._release, None
+        connection, self._connection = self._connection, None
+        release(connection)
+
     def readable(self):
         """ Indicates that the response reader is readable."""
         return True
@@ -1344,6 +1359,24 @@ class ResponseReader(io.RawIOBase):
         return bytes_read
 
 
+def _connector(key_file=None, cert_file=None, timeout=None, verify=False):
+    def connect(scheme, host, port):
+        kwargs = {}
+        if timeout is not None: kwargs['timeout'] = timeout
+        if scheme == "http":
+            return six.moves.http_client.HTTPConnection(host, port, **kwargs)
+        if scheme == "https":
+            if key_file is not None: kwargs['key_file'] = key_file
+            if cert_file is not None: kwargs['cert_file'] = cert_file
+
+            if not verify:
+                kwargs['context'] = ssl._create_unverified_context()
+            return six.moves.http_client.HTTPSConnection(host, port, **kwargs)
+        raise ValueError("unsupported scheme: %s" % scheme)
+
+    return connect
+
+
 def handler(key_file=None, cert_file=None, timeout=None, verify=False):
     """This class returns an instance of the default HTTP request handler using
     the values you provide.
@@ -1358,19 +1391,7 @@ def handler(key_file=None, cert_file=None, timeout=None, verify=False):
     :type verify: ``Boolean``
     """
 
-    def connect(scheme, host, port):
-        kwargs = {}
-        if timeout is not None: kwargs['timeout'] = timeout
-        if scheme == "http":
-            return six.moves.http_client.HTTPConnection(host, port, **kwargs)
-        if scheme == "https":
-            if key_file is not None: kwargs['key_file'] = key_file
-            if cert_file is not None: kwargs['cert_file'] = cert_file
-
-            if not verify:
-                kwargs['context'] = ssl._create_unverified_context()
-            return six.moves.http_client.HTTPSConnection(host, port, **kwargs)
-        raise ValueError("unsupported scheme: %s" % scheme)
+    connect = _connector(key_file, cert_file, timeout, verify)
 
     def request(url, message, **kwargs):
         scheme, host, port, path = _spliturl(url)
@@ -1406,3 +1427,126 @@ def handler(key_file=None, cert_file=None, timeout=None, verify=False):
         }
 
     return request
+
+
+class _ConnectionPool(object):
+    """Idle keep-alive connections, kept per ``(scheme, host, port)``.
+
+    At most ``maxsize`` idle connections are kept for each key. Connections
+    released beyond that are closed. The pool is safe to share between threads.
+    """
+    def __init__(self, connect, maxsize):
+        self._connect = connect
+        self._maxsize = maxsize
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """Returns an idle connection for *key* and whether it was reused."""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(*key), False
+
+    def release(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._maxsize:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in six.itervalues(idle):
+            for connection in connections:
+                connection.close()
+
+
+def _closed_before_response(e, sent):
+    """Returns whether *e*, raised while sending a request on a kept-alive
+    connection (*sent* is False) or while waiting for its response, shows
+    that the server had already closed the connection."""
+    if isinstance(e, socket.timeout):
+        return False
+    if not sent:
+        return isinstance(e, socket.error) and e.errno in (errno.ECONNRESET, errno.EPIPE)
+    # RemoteDisconnected in Python 3, BadStatusLine for the empty status line in Python 2
+    return isinstance(e, six.moves.http_client.BadStatusLine) and e.line == repr("")
+
+
+def pooled_handler(key_file=None, cert_file=None, timeout=None, verify=False, pool_size=4):
+    """Returns an HTTP request handler like :func:`handler` that keeps
+    connections to splunkd alive and reuses them across requests.
+
+    A connection goes back to the pool once its response body has been read to
+    the end. A request is sent again, on another connection, only when the
+    reused connection it was sent on turns out to have been closed by the
+    server before answering: sending it failed with a reset or a broken pipe,
+    or the connection was closed without a byte of the response. Timeouts are
+    never retried, since splunkd may still be acting on the request.
+
+    :param `key_file`: A path to a PEM (Privacy Enhanced Mail) formatted file containing your private key (optional).
+    :type key_file: ``string``
+    :param `cert_file`: A path to a PEM (Privacy Enhanced Mail) formatted file containing a certificate chain file (optional).
+    :type cert_file: ``string``
+    :param `timeout`: The request time-out period, in seconds (optional).
+    :type timeout: ``integer`` or "None"
+    :param `verify`: Set to False to disable SSL verification on https connections.
+    :type verify: ``Boolean``
+    :param `pool_size`: The number of idle connections kept for each host (optional).
+    :type pool_size: ``integer``
+    """
+
+    pool = _ConnectionPool(_connector(key_file, cert_file, timeout, verify), pool_size)
+
+    def request(url, message, **kwargs):
+        scheme, host, port, path = _spliturl(url)
+        body = message.get("body", "")
+        head = {
+            "Content-Length": str(len(body)),
+            "Host": host,
+            "User-Agent": "splunk-sdk-python/1.6.13",
+            "Accept": "*/*",
+            "Connection": "Keep-Alive",
+        } # defaults
+        for key, value in message["headers"]:
+            head[key] = value
+        method = message.get("method", "GET")
+        key = (scheme, host, port)
+
+        while True:
+            connection, reused = pool.acquire(key)
+            sent = False
+            try:
+                connection.request(method, path, body, head)
+                sent = True
+                if timeout is not None:
+                    connection.sock.settimeout(timeout)
+                response = connection.getresponse()
+            except BaseException as e:
+                connection.close()
+                if not (reused and _closed_before_response(e, sent)):
+                    raise
+            else:
+                break
+
+        if response.will_close:
+            return {
+                "status": response.status,
+                "reason": response.reason,
+                "headers": response.getheaders(),
+                "body": ResponseReader(response, connection),
+            }
+
+        return {
+            "status": response.status,
+            "reason": response.reason,
+            "headers": response.getheaders(),
+            "body": ResponseReader(response, connection, lambda connection: pool.release(key, connection)),
+        }
+
+    request.pool = pool
+    return request
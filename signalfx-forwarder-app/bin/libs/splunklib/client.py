@@ -60,14 +60,19 @@ attributes, and methods that are specific to each kind of entity. For example::
 
 import contextlib
 import datetime
+import io
 import json
 import logging
+import re
 import socket
+import sys
+import threading
 from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 from time import sleep
 
 from splunklib import six
-from splunklib.six.moves import urllib
+from splunklib.six.moves import queue, urllib
 
 from . import data
 from .binding import (AuthenticationError, Context, HTTPError, UrlEncoded,
@@ -223,6 +228,86 @@ def _load_atom_entries(response):
         return entries if isinstance(entries, list) else [entries]
 
 
+# Whether the body of the given response is JSON, as requested with
+# output_mode=json, rather than Atom
+def _is_json(response):
+    headers = response.headers
+    if isinstance(headers, dict):
+        headers = list(headers.items())
+    for key, value in headers:
+        if key.lower() == 'content-type':
+            return value.startswith('application/json')
+    return False
+
+
+# Load the entity state records from the body of the given response, which
+# is either an Atom feed or its JSON equivalent
+def _load_states(response):
+    if _is_json(response):
+        body = json.loads(response.body.read().decode('utf-8'))
+        return [_parse_json_entry(entry) for entry in body.get('entry') or []]
+    entries = _load_atom_entries(response)
+    if entries is None: return []
+    return [_parse_atom_entry(entry) for entry in entries]
+
+
+# The total number of entities in a collection, as splunkd reports it when
+# returning one page of them, in Atom and in JSON
+_PAGING_TOTAL = re.compile(br'<opensearch:totalResults>(\d+)<|"paging":\s*\{[^}]*"total":\s*(\d+)')
+
+
+# Load the total number of entities from the body of the given response,
+# leaving the body to be read again. Returns None if splunkd doesn't say.
+def _load_total(response):
+    body = response.body.read()
+    response.body = io.BytesIO(body)
+    match = _PAGING_TOTAL.search(body)
+    if match is None:
+        return None
+    return int(match.group(1) or match.group(2))
+
+
+# Iterate over the given iterable on a background thread, keeping up to
+# lookahead of its items ready ahead of the caller
+def _prefetch(iterable, lookahead):
+    ready = queue.Queue(lookahead)
+    stopped = threading.Event()
+    end = object()
+
+    def put(item):
+        # Give up waiting for room once the caller has stopped iterating
+        while not stopped.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except Exception:
+            put((end, sys.exc_info()))
+
+    thread = threading.Thread(target=produce, name="splunklib-prefetch")
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, error = ready.get()
+            if item is end:
+                if error is not None:
+                    six.reraise(*error)
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
 # Load the sid from the body of the given response
 def _load_sid(response):
     return _load_atom(response).response.sid
@@ -282,6 +367,39 @@ def _parse_atom_metadata(content):
 
     return record({'access': access, 'fields': fields})
 
+
+# Parse the given JSON entry into the same entity state record that
+# _parse_atom_entry builds from the Atom entry
+def _parse_json_entry(entry):
+    content = record((k, _json_value(v)) for k, v in six.iteritems(entry.get('content') or {})
+                     if k not in ['eai:acl', 'eai:attributes'])
+    fields = entry.get('fields') or {}
+    return record({
+        'title': entry.get('name'),
+        'links': record(entry.get('links') or {}),
+        'access': _json_value(entry.get('acl')),
+        'fields': record({
+            'required': fields.get('required', []),
+            'optional': fields.get('optional', []),
+            'wildcard': fields.get('wildcard', [])}),
+        'content': content,
+        'updated': entry.get('updated')
+    })
+
+
+# Convert a JSON value to the form Atom gives it: every scalar is a string,
+# with booleans as "1" and "0", and every object is a record
+def _json_value(value):
+    if isinstance(value, six.string_types) or value is None:
+        return value
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, dict):
+        return record((k, _json_value(v)) for k, v in six.iteritems(value))
+    if isinstance(value, list):
+        return [_json_value(v) for v in value]
+    return str(value)
+
 # kwargs: scheme, host, port, app, owner, username, password
 def connect(**kwargs):
     """This function connects and logs in to a Splunk instance.
@@ -384,6 +502,10 @@ class Service(_BaseService):
     :param `password`: The password, which is used to authenticate the Splunk
                        instance.
     :type password: ``string``
+    :param entity_output_mode: The format entities and collections are read
+        in (the default is "xml", for Atom). Reading them as "json" is
+        considerably faster for large collections.
+    :type entity_output_mode: "xml" or "json"
     :return: A :class:`Service` instance.
 
     **Example**::
@@ -401,6 +523,7 @@ class Service(_BaseService):
     def __init__(self, **kwargs):
         super(Service, self).__init__(**kwargs)
         self._splunk_version = None
+        self.entity_output_mode = kwargs.get("entity_output_mode", "xml")
 
     @property
     def apps(self):
@@ -765,6 +888,15 @@ class Endpoint(object):
                                 owner=owner, app=app, sharing=sharing,
                                 **query)
 
+    def _entity_query(self, **query):
+        """Returns *query*, the parameters of a request whose response is read
+        into entities, asking for the service's ``entity_output_mode``.
+        """
+        output_mode = getattr(self.service, 'entity_output_mode', 'xml')
+        if output_mode != 'xml':
+            query.setdefault('output_mode', output_mode)
+        return query
+
     def post(self, path_segment="", owner=None, app=None, sharing=None, **query):
         """Performs a POST operation on the path segment relative to this endpoint.
 
@@ -959,6 +1091,11 @@ class Entity(Endpoint):
 
     # Load the entity state record from the given response
     def _load_state(self, response):
+        if _is_json(response):
+            states = _load_states(response)
+            if len(states) > 1:
+                raise AmbiguousReferenceException("Fetch from server returned multiple entries for name %s." % self.name)
+            return states[0]
         entry = self._load_atom_entry(response)
         return _parse_atom_entry(entry)
 
@@ -1036,7 +1173,7 @@ class Entity(Endpoint):
         if state is not None:
             self._state = state
         else:
-            self._state = self.read(self.get())
+            self._state = self.read(self.get(**self._entity_query()))
         return self
 
     @property
@@ -1234,10 +1371,10 @@ class ReadOnlyCollection(Endpoint):
                 # have to extract values out.
                 key, ns = key
                 key = UrlEncoded(key, encode_slash=True)
-                response = self.get(key, owner=ns.owner, app=ns.app)
+                response = self.get(key, owner=ns.owner, app=ns.app, **self._entity_query())
             else:
                 key = UrlEncoded(key, encode_slash=True)
-                response = self.get(key)
+                response = self.get(key, **self._entity_query())
             entries = self._load_list(response)
             if len(entries) > 1:
                 raise AmbiguousReferenceException("Found multiple entities named '%s'; please specify a namespace." % key)
@@ -1337,16 +1474,15 @@ class ReadOnlyCollection(Endpoint):
 
         The ``'body'`` key refers to a stream containing an Atom feed,
         that is, an XML document with a toplevel element ``<feed>``,
-        and within that element one or more ``<entry>`` elements.
+        and within that element one or more ``<entry>`` elements, or
+        the equivalent JSON document if it was requested with
+        ``output_mode=json``.
         """
         # Some subclasses of Collection have to override this because
         # splunkd returns something that doesn't match
         # <feed><entry></entry><feed>.
-        entries = _load_atom_entries(response)
-        if entries is None: return []
         entities = []
-        for entry in entries:
-            state = _parse_atom_entry(entry)
+        for state in _load_states(response):
             entity = self.item(
                 self.service,
                 self._entity_path(state),
@@ -1394,19 +1530,26 @@ class ReadOnlyCollection(Endpoint):
         content = _load_atom(response, MATCH_ENTRY_CONTENT)
         return _parse_atom_metadata(content)
 
-    def iter(self, offset=0, count=None, pagesize=None, **kwargs):
+    def iter(self, offset=0, count=None, pagesize=None, prefetch=0, **kwargs):
         """Iterates over the collection.
 
         This method is equivalent to the :meth:`list` method, but
         it returns an iterator and can load a certain number of entities at a
         time from the server.
 
+        With a *pagesize* and *prefetch*, pages are loaded on a background
+        thread while the caller works through the entities already loaded, so
+        that the caller rarely waits on the server.
+
         :param offset: The index of the first entity to return (optional).
         :type offset: ``integer``
         :param count: The maximum number of entities to return (optional).
         :type count: ``integer``
         :param pagesize: The number of entities to load (optional).
         :type pagesize: ``integer``
+        :param prefetch: The number of pages to load ahead of the caller
+            (optional, the default is 0, for none).
+        :type prefetch: ``integer``
         :param kwargs: Additional arguments (optional):
 
             - "search" (``string``): The search query to filter responses.
@@ -1431,23 +1574,35 @@ class ReadOnlyCollection(Endpoint):
                 ...
         """
         assert pagesize is None or pagesize > 0
+        pages = self._iter_pages(offset, count, pagesize, **kwargs)
+        if pagesize is not None and prefetch > 0:
+            pages = _prefetch(pages, prefetch)
+        for items in pages:
+            for item in items:
+                yield item
+
+    def _iter_pages(self, offset, count, pagesize, **kwargs):
+        """Loads the entities of the collection a page at a time, yielding
+        the list of entities on each page."""
         if count is None:
             count = self.null_count
         fetched = 0
         while count == self.null_count or fetched < count:
-            response = self.get(count=pagesize or count, offset=offset, **kwargs)
+            page_count = pagesize or count
+            if pagesize is not None and count != self.null_count:
+                page_count = min(pagesize, count - fetched)
+            response = self.get(count=page_count, offset=offset, **self._entity_query(**kwargs))
             items = self._load_list(response)
             N = len(items)
             fetched += N
-            for item in items:
-                yield item
-            if pagesize is None or N < pagesize:
+            yield items
+            if pagesize is None or N < page_count:
                 break
             offset += N
             logging.debug("pagesize=%d, fetched=%d, offset=%d, N=%d, kwargs=%s", pagesize, fetched, offset, N, kwargs)
 
-    # kwargs: count, offset, search, sort_dir, sort_key, sort_mode
-    def list(self, count=None, **kwargs):
+    # kwargs: count, offset, pagesize, search, sort_dir, sort_key, sort_mode
+    def list(self, count=None, concurrency=None, **kwargs):
         """Retrieves a list of entities in this collection.
 
         The entire collection is loaded at once and is returned as a list. This
@@ -1455,12 +1610,21 @@ class ReadOnlyCollection(Endpoint):
         the ``autologin`` field of :func:`connect` is set to ``True``.
         There is no caching--every call makes at least one round trip.
 
+        With a ``pagesize`` and a *concurrency* greater than 1, the first page
+        is loaded on its own to learn how many entities there are, then the
+        remaining pages are loaded *concurrency* at a time.
+
         :param count: The maximum number of entities to return (optional).
         :type count: ``integer``
+        :param concurrency: The number of pages to load at once (optional).
+        :type concurrency: ``integer``
         :param kwargs: Additional arguments (optional):
 
             - "offset" (``integer``): The offset of the first item to return.
 
+            - "pagesize" (``integer``): The number of entities to load in each
+              request.
+
             - "search" (``string``): The search query to filter responses.
 
             - "sort_dir" (``string``): The direction to sort returned items:
@@ -1476,9 +1640,47 @@ class ReadOnlyCollection(Endpoint):
         """
         # response = self.get(count=count, **kwargs)
         # return self._load_list(response)
-        return list(self.iter(count=count, **kwargs))
-
-
+        if concurrency is None or concurrency < 2 or kwargs.get('pagesize') is None:
+            return list(self.iter(count=count, **kwargs))
+        return self._list_concurrently(count, concurrency, **kwargs)
+
+    def _list_concurrently(self, count, concurrency, offset=0, pagesize=None, **kwargs):
+        """Loads the first page of the collection, then the rest
+        *concurrency* pages at a time, and returns all their entities."""
+        if count == 0:
+            # splunkd takes a count of 0 to mean all of them
+            return []
+        query = self._entity_query(**kwargs)
+        stop = None if count is None or count == self.null_count else offset + count
+
+        def load_page(page_offset):
+            page_count = pagesize if stop is None else min(pagesize, stop - page_offset)
+            return self._load_list(self.get(count=page_count, offset=page_offset, **query))
+
+        first = pagesize if stop is None else min(pagesize, count)
+        response = self.get(count=first, offset=offset, **query)
+        total = _load_total(response)
+        items = self._load_list(response)
+        if len(items) < first:
+            return items
+        offset += len(items)
+        if stop is not None and offset >= stop:
+            return items
+        if total is None:
+            # Without the total, the remaining pages can only be found one after another
+            remaining = None if stop is None else stop - offset
+            items.extend(self.iter(offset=offset, count=remaining, pagesize=pagesize, **kwargs))
+            return items
+
+        offsets = list(range(offset, total if stop is None else min(stop, total), pagesize))
+        if offsets:
+            pool = ThreadPool(min(concurrency, len(offsets)))
+            try:
+                for page in pool.map(load_page, offsets):
+                    items.extend(page)
+            finally:
+                pool.terminate()
+        return items
 
 
 class Collection(ReadOnlyCollection):
@@ -2912,14 +3114,11 @@ class Jobs(Collection):
 
     def _load_list(self, response):
         # Overridden because Job takes a sid instead of a path.
-        entries = _load_atom_entries(response)
-        if entries is None: return []
         entities = []
-        for entry in entries:
-            state = _parse_atom_entry(entry)
+        for state in _load_states(response):
             entity = self.item(
                 self.service,
-                entry['content']['sid'],
+                state.content['sid'],
                 state=state)
             entities.append(entity)
         return entities
@@ -2968,6 +3167,10 @@ class Jobs(Collection):
         them available later. As soon as results are ready, you will receive
         them.
 
+        Large exports are read much faster as JSON: pass ``output_mode="json"``
+        and read the handle with :class:`splunklib.results.JSONResultsReader`
+        instead.
+
         The ``export`` method makes a single roundtrip to the server (as opposed
         to two for :meth:`create` followed by :meth:`preview`), plus at most two
         more if the ``autologin`` field of :func:`connect` is set to ``True``.
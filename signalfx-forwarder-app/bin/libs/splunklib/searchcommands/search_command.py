@@ -27,8 +27,8 @@ try:
 except ImportError:
     from ..ordereddict import OrderedDict
 from copy import deepcopy
-from splunklib.six.moves import StringIO
 from itertools import chain, islice
+from operator import itemgetter
 from splunklib.six.moves import filter as ifilter, map as imap, zip as izip
 from splunklib import six
 if six.PY2:
@@ -56,9 +56,11 @@ import traceback
 # Relative imports
 
 from .internals import (
+    ChunkReader,
     CommandLineParser,
     CsvDialect,
     InputHeader,
+    LightweightRecord,
     Message,
     MetadataDecoder,
     MetadataEncoder,
@@ -66,9 +68,12 @@ from .internals import (
     Recorder,
     RecordWriterV1,
     RecordWriterV2,
+    iter_lines,
     json_encode_string)
 
 from . import Boolean, Option, environment
+from .decorators import ConfigurationSetting
+from ..binding import pooled_handler
 from ..client import Service
 
 
@@ -370,8 +375,11 @@ class SearchCommand(object):
 
         uri = urlsplit(splunkd_uri, allow_fragments=False)
 
+        # Commands typically make several REST calls in a row, so keep the connection to splunkd open between them.
+        # Entities are read as JSON, which is much cheaper to parse than Atom.
         self._service = Service(
-            scheme=uri.scheme, host=uri.hostname, port=uri.port, app=searchinfo.app, token=searchinfo.session_key)
+            scheme=uri.scheme, host=uri.hostname, port=uri.port, app=searchinfo.app, token=searchinfo.session_key,
+            handler=pooled_handler(), entity_output_mode='json')
 
         return self._service
 
@@ -651,6 +659,7 @@ class SearchCommand(object):
 
         debug('%s.process started under protocol_version=2', class_name)
         self._protocol_version = 2
+        ifile = ChunkReader.wrap(ifile)
 
         # Read search command metadata from splunkd
         # noinspection PyBroadException
@@ -895,6 +904,71 @@ class SearchCommand(object):
 
     _header = re.compile(r'chunked\s+1.0\s*,\s*(\d+)\s*,\s*(\d+)\s*\n')
 
+    def _lightweight_records(self, fieldnames, reader):
+        """ Yields a :class:`LightweightRecord` for each row of :code:`reader`.
+
+        All records share one header. Multivalue fields are folded into their single-value counterparts and decoded
+        only when they hold a value. A duplicated field name keeps the position of its first occurrence and, as with
+        the :class:`OrderedDict` records, the value of its last occurrence unless there are multivalue fields, in which
+        case the first one wins. A field that only has a multivalue column is empty in the rows where that column is.
+
+        """
+        names = []
+        positions = {}
+        mv_fieldnames = []
+        last_wins = not any(fieldname.startswith('__mv_') for fieldname in fieldnames)
+
+        for i, fieldname in enumerate(fieldnames):
+            if fieldname.startswith('__mv_'):
+                mv_fieldnames.append((fieldname[len('__mv_'):], i))
+            elif fieldname not in positions:
+                positions[fieldname] = i
+                names.append(fieldname)
+            elif last_wins:
+                positions[fieldname] = i
+
+        for fieldname, _ in mv_fieldnames:
+            if fieldname not in positions:
+                positions[fieldname] = None
+                names.append(fieldname)
+
+        header = LightweightRecord.Header(names)
+        mv_positions = [(header.index[fieldname], i) for fieldname, i in mv_fieldnames]
+        layout = [positions[name] for name in names]
+
+        if len(mv_positions) == 0 and layout == list(range(len(fieldnames))):
+            for values in reader:
+                yield LightweightRecord(header, values)
+            return
+
+        # splunkd sends an __mv_ column for every field, but few of them hold a value in any given row. Pick the
+        # single values and check the multivalue columns in bulk, falling back to per-cell work only when needed
+
+        if None in layout:
+            get_row = lambda values: ['' if i is None else values[i] for i in layout]
+        elif len(layout) == 1:
+            get_row = lambda values, i=layout[0]: [values[i]]
+        else:
+            get_row = lambda values, get=itemgetter(*layout): list(get(values))
+
+        if len(mv_positions) == 1:
+            get_mv = lambda values, i=mv_positions[0][1]: (values[i],)
+        elif len(mv_positions) > 1:
+            get_mv = itemgetter(*[mv_i for _, mv_i in mv_positions])
+        else:
+            get_mv = lambda values: ()
+
+        decode_list = self._decode_list
+
+        for values in reader:
+            row = get_row(values)
+            if any(get_mv(values)):
+                for i, mv_i in mv_positions:
+                    value = values[mv_i]
+                    if len(value) > 0:
+                        row[i] = decode_list(value)
+            yield LightweightRecord(header, row)
+
     def _records_protocol_v1(self, ifile):
 
         reader = csv.reader(ifile, dialect=CsvDialect)
@@ -904,6 +978,11 @@ class SearchCommand(object):
         except StopIteration:
             return
 
+        if self._configuration.lightweight_records:
+            for record in self._lightweight_records(fieldnames, reader):
+                yield record
+            return
+
         mv_fieldnames = dict([(name, name[len('__mv_'):]) for name in fieldnames if name.startswith('__mv_')])
 
         if len(mv_fieldnames) == 0:
@@ -939,7 +1018,7 @@ class SearchCommand(object):
             self._record_writer.is_flushed = False
 
             if len(body) > 0:
-                reader = csv.reader(StringIO(body), dialect=CsvDialect)
+                reader = csv.reader(iter_lines(body), dialect=CsvDialect)
 
                 try:
                     fieldnames = next(reader)
@@ -948,7 +1027,10 @@ class SearchCommand(object):
 
                 mv_fieldnames = dict([(name, name[len('__mv_'):]) for name in fieldnames if name.startswith('__mv_')])
 
-                if len(mv_fieldnames) == 0:
+                if self._configuration.lightweight_records:
+                    for record in self._lightweight_records(fieldnames, reader):
+                        yield record
+                elif len(mv_fieldnames) == 0:
                     for values in reader:
                         yield OrderedDict(izip(fieldnames, values))
                 else:
@@ -1020,6 +1102,24 @@ class SearchCommand(object):
             text = ', '.join(['{}={}'.format(name, json_encode_string(six.text_type(value))) for (name, value) in six.iteritems(self)])
             return text
 
+        # region Local properties
+
+        lightweight_records = ConfigurationSetting(doc='''
+            :const:`True`, if records should be read as :class:`LightweightRecord` objects rather than as
+            :class:`OrderedDict` objects.
+
+            A lightweight record holds a reference to the list of values parsed from its row and a header shared by all
+            records of the same chunk. It supports the mapping operations used to write output records, including
+            adding fields, but it is not a :class:`dict`.
+
+            Default: :const:`False`
+
+            Supported by: SCP 1 and SCP 2; never sent to splunkd
+
+            ''')
+
+        # endregion
+
         # region Methods
 
         @classmethod
@@ -1,9 +1,6 @@
-import gzip
-import json
 import os
 import sys
-from collections import OrderedDict
-from io import BytesIO
+from collections import OrderedDict, deque
 
 current_path = os.path.dirname(__file__)  # pylint: disable=invalid-name
 sys.path.append(os.path.join(current_path, "libs"))
@@ -18,10 +15,103 @@ from splunklib.searchcommands import (  # isort:skip pylint: disable=import-erro
 )
 
 import requests  # isort:skip
+from sfxlib import protobuf  # isort:skip pylint: disable=import-error
+from sfxlib.compression import DEFAULT_LEVEL, compress  # isort:skip pylint: disable=import-error
+from sfxlib.datapoints import (  # isort:skip pylint: disable=import-error
+    DATAPOINT_JSON_OVERHEAD,
+    DimensionCache,
+    FieldPlan,
+    iter_json,
+)
+from sfxlib.forwarder import Forwarder  # isort:skip pylint: disable=import-error
+from sfxlib.ratelimit import RateLimiter  # isort:skip pylint: disable=import-error
+from sfxlib.retry import RetryPolicy, post_with_retry  # isort:skip pylint: disable=import-error
+from sfxlib.rollup import GAUGE_AGGREGATIONS, Rollup  # isort:skip pylint: disable=import-error
+from sfxlib.sender import PendingBatch  # isort:skip pylint: disable=import-error
 
 
-@Configuration()
-class ToSFXCommand(EventingCommand):
+class DatapointForwarder(Forwarder):
+    """
+    Builds datapoints from search results and sends them to SignalFx in
+    batches, handing each result back once the batch it is part of has been
+    sent.  Mixed into the search commands that forward datapoints.
+    """
+
+    spool_name = "datapoint"
+    _dimension_cache = None
+    dp_endpoint = Option(default="/v2/datapoint")
+    batch_size = Option(validate=validators.Integer(minimum=1), default=10000)
+    batch_bytes = Option(validate=validators.Integer(minimum=1), default=4 * 1024 * 1024)
+    format = Option(validate=validators.Set("json", "protobuf"), default="json")
+    rollup = Option(validate=validators.Duration())
+    rollup_gauge = Option(validate=validators.Set(*GAUGE_AGGREGATIONS), default="last")
+    max_dpm = Option(validate=validators.Integer(minimum=1))
+    max_requests_per_sec = Option(validate=validators.Integer(minimum=1))
+
+    @property
+    def endpoint(self):
+        return self.dp_endpoint
+
+    def new_rate_limiter(self):
+        if self.max_dpm or self.max_requests_per_sec:
+            return RateLimiter(max_dpm=self.max_dpm, max_requests_per_sec=self.max_requests_per_sec)
+        return None
+
+    def new_batch(self, previous=None):
+        if previous is None:
+            # Dimensions are interned once for the whole search
+            self._dimension_cache = DimensionCache()
+            rollup = Rollup(self.rollup * 1000, gauge=self.rollup_gauge) if self.rollup else None
+        elif previous.rollup is not None:
+            rollup = previous.rollup.split_open_bucket(max_datapoints=self.batch_size, max_size=self.batch_bytes)
+        else:
+            rollup = None
+        return DatapointBatch(self._dimension_cache, rollup=rollup, keep_events=self.output != "summary")
+
+    def batch_full(self):
+        return self._batch.datapoints >= self.batch_size or self._batch.size >= self.batch_bytes
+
+    def submit_batch(self, final=False):
+        """
+        Sends the current batch and starts a new one.  With a rollup, the
+        aggregates of the time bucket still being filled move to the new
+        batch unless this is the `final` batch.
+        """
+        batch = self._batch
+        self._batch = None if final else self.new_batch(previous=batch)
+        # Only built once the open bucket has been carried over, which may leave nothing to send
+        payload = batch.build_payload()
+        if not batch.rows and not payload:
+            return
+
+        datapoints = sum(len(values) for values in payload.values())
+        self._metrics.add("rows", batch.rows)
+        self._metrics.add("datapoints", datapoints)
+        if self._sender is None or not payload:
+            # Nothing is sent when every datapoint of the batch's events was carried over with the open bucket
+            pending = PendingBatch(payload, batch.events, datapoints, batch.rows)
+            pending.finish()
+        else:
+            pending = self._sender.submit(payload, batch.events, datapoints, batch.rows)
+        self._in_flight.append(pending)
+
+    def send(self, session, payload):
+        return send_payload(
+            payload=payload,
+            target_url=compose_ingest_url(self.ingest_url, self.dp_endpoint),
+            token=self.access_token,
+            session=session,
+            retry_policy=self._retry_policy,
+            spool=self._spool,
+            data_format=self.format,
+            compression=self.compression,
+            compression_level=self.compression_level,
+            metrics=self._metrics,
+        )
+
+
+@Configuration(lightweight_records=True)
+class ToSFXCommand(DatapointForwarder, EventingCommand):
     """
     ## Syntax
 
@@ -36,82 +126,45 @@ class ToSFXCommand(EventingCommand):
 
     """
 
-    access_token = None
-    debug = Option(validate=validators.Boolean(), default=False)
-    dry_run = Option(validate=validators.Boolean(), default=False)
-    ingest_url = Option(validate=validators.Match("https://.*", r"^https://.*"))
-    dp_endpoint = Option(default="/v2/datapoint")
-
-    SPLUNK_PASSWORD_REALM = "realm"
-    SPLUNK_PASSWORD_USER_NAME = "username"
-    SPLUNK_PASSWORD_CLEAR_PASSWORD = "clear_password"
-    SPLUNK_KV_STORE_SFX_CONFIG_COLLECTION_NAME = "sfx_ingest_config"
-    SPLUNK_SFX_CONFIG_INGEST_URL_KEY = "ingest_url"
-    SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_REALM = "sfx_ingest_command"
-    SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_USER_NAME = "access_token"
-
-    def ensure_default_config(self):
-        if not self.ingest_url:
-            self.ingest_url = self.get_sfx_ingest_url()
-
-        self.logger.error("getting access token")
-        self.access_token = self.get_access_token()
-
-    def get_access_token(self):
-        try:
-            for credential in self.service.storage_passwords:
-                if (
-                    credential.content.get(self.SPLUNK_PASSWORD_REALM, None)
-                    == self.SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_REALM
-                    and credential.content.get(self.SPLUNK_PASSWORD_USER_NAME, None)
-                    == self.SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_USER_NAME
-                ):
-                    return credential.content.get(self.SPLUNK_PASSWORD_CLEAR_PASSWORD, None)
-        except Exception as e:  # pylint:disable=broad-except
-            self.logger.error("status=error, action=get_sfx_access_token, error_msg=%s", e, exc_info=True)
-        return None
-
-    def get_sfx_ingest_url(self):
-        try:
-            sfx_api_config_collection = self.service.kvstore.get(self.SPLUNK_KV_STORE_SFX_CONFIG_COLLECTION_NAME, None)
-            if sfx_api_config_collection is not None:
-                collection = self.service.kvstore[self.SPLUNK_KV_STORE_SFX_CONFIG_COLLECTION_NAME]
-                # will return a list of settings, we should only have one.
-                # We'll grab the 'last' / most recent one by default
-                sfx_ingest_config_records = collection.data.query()
-                if sfx_ingest_config_records:
-                    sfx_ingest_config_latest = sfx_ingest_config_records[-1]
-                    return sfx_ingest_config_latest.get(self.SPLUNK_SFX_CONFIG_INGEST_URL_KEY, None)
-        except Exception as e:  # pylint:disable=broad-except
-            self.logger.error("status=error, action=get_sfx_ingest_url, error_msg=%s", str(e), exc_info=True)
-        return None
-
     def transform(self, records):
-        self.ensure_default_config()
+        return self.forward(records)
 
-        out = []
-        payload = OrderedDict()
-        for event in records:
-            add_event_to_payload(event=event, payload=payload)
 
-            if self.debug:
-                event["endpoint"] = self.ingest_url + self.dp_endpoint
-
-            out.append(event)
+class DatapointBatch(object):
+    """
+    The datapoints built from a run of consecutive events, kept alongside the
+    events so that the send status can be attached to them.  Only the number
+    of `rows` is kept unless `keep_events` is set.  `size` is an estimate of
+    the uncompressed JSON size of the payload.  When a `rollup` is given,
+    datapoints are aggregated into it and `datapoints` counts the aggregated
+    datapoints.
+    """
 
-        if not self.dry_run:
-            resp = send_payload(
-                payload=payload,
-                target_url=compose_ingest_url(self.ingest_url, self.dp_endpoint),
-                token=self.access_token,
+    def __init__(self, dimension_cache=None, rollup=None, keep_events=True):
+        self.payload = OrderedDict()
+        self.events = []
+        self.rows = 0
+        self.keep_events = keep_events
+        self.datapoints = 0 if rollup is None else len(rollup)
+        self.size = 0 if rollup is None else rollup.size
+        self.dimension_cache = dimension_cache
+        self.rollup = rollup
+
+    def add(self, event):
+        if self.rollup is None:
+            datapoints, size = add_event_to_payload(
+                event=event, payload=self.payload, dimension_cache=self.dimension_cache
             )
-            for event in out:
-                event["status"] = resp.status_code
-                if resp.status_code != 200:
-                    event["response_error"] = resp.content
+        else:
+            datapoints, size = self.rollup.add(*classify_event(event, self.dimension_cache))
+        if self.keep_events:
+            self.events.append(event)
+        self.rows += 1
+        self.datapoints += datapoints
+        self.size += size
 
-        for event in out:
-            yield event
+    def build_payload(self):
+        return self.payload if self.rollup is None else self.rollup.payload()
 
 
 def compose_ingest_url(ingest_base_url, dp_endpoint):
@@ -119,63 +172,92 @@ def compose_ingest_url(ingest_base_url, dp_endpoint):
 
 
 def populate_payload(metric_type, metric_list, payload, timestamp, dims):
-    expanded = []
-    for metric, value in metric_list:
-        expanded.append(dict([("metric", metric), ("value", value)]))
-        if timestamp:
-            expanded[-1]["timestamp"] = timestamp
-        expanded[-1]["dimensions"] = dims
-    if metric_type in payload:
-        # Append in reverse order because SignalFx expects data points oldest to latest
-        payload[metric_type] = expanded + payload[metric_type]
+    if metric_type not in payload:
+        payload[metric_type] = deque()
+    # Prepend because events arrive latest first and SignalFx expects data points oldest to latest
+    payload[metric_type].extendleft(
+        [(metric, value, timestamp, dims) for metric, value in reversed(metric_list)]
+    )
+
+
+# Used when adding events to a payload without a cache of their own
+DEFAULT_DIMENSION_CACHE = DimensionCache()
+
+
+def classify_event(event, dimension_cache=None):
+    """
+    Returns the timestamp, interned dimensions and metrics of the datapoints
+    generated from `event`, as described by `FieldPlan.apply`.
+    """
+    fieldnames = getattr(event, "fieldnames", None)
+    if fieldnames is None:
+        plan = FieldPlan.compile(tuple(event))
+        timestamp, dimensions, metrics = plan.apply(tuple(event.values()))
     else:
-        payload[metric_type] = expanded
-
-
-def add_event_to_payload(event, payload):
-    gauges = []
-    counters = []
-    cumulative_counters = []
-    dimensions = dict()
-    timestamp = None
-    for key, value in event.items():
-        if value != "":
-            if key.startswith("gauge_"):
-                try:
-                    value = int(value)
-                except ValueError:
-                    value = float(value)
-                gauges.append((key[len("gauge_") :], value))
-            elif key.startswith("counter_"):
-                counters.append((key[len("counter_") :], int(value)))
-            elif key.startswith("cumulative_counter_"):
-                cumulative_counters.append((key[len("cumulative_counter_") :], int(value)))
-            elif key == "_time":
-                timestamp = int(float(value) * 1000)
-            elif not key.startswith("_") and key != "punct" and not key.startswith("date_"):
-                if value[0] != "_" and len(value) < 256:
-                    dimensions[key.replace(".", "_")] = value
-
-    if gauges:
-        populate_payload("gauge", gauges, payload, timestamp, dimensions)
-    if counters:
-        populate_payload("counter", counters, payload, timestamp, dimensions)
-    if cumulative_counters:
-        populate_payload("cumulative_counter", cumulative_counters, payload, timestamp, dimensions)
-
-
-def send_payload(payload, target_url, token):
-    body = BytesIO()
-    with gzip.GzipFile(fileobj=body, mode="w") as fd:
-        fd.write(json.dumps(payload).encode("utf-8"))
-    body.seek(0)
-
-    resp = requests.post(
+        # Lightweight records expose their row directly; no need to copy it
+        plan = FieldPlan.compile(fieldnames)
+        timestamp, dimensions, metrics = plan.apply(event.row)
+    if not metrics:
+        return None, None, metrics
+
+    return timestamp, (dimension_cache or DEFAULT_DIMENSION_CACHE).intern(dimensions), metrics
+
+
+def add_event_to_payload(event, payload, dimension_cache=None):
+    """
+    Adds the datapoints generated from `event` to `payload`.  Returns the
+    number of datapoints added and an estimate of their serialized size.
+    """
+    timestamp, dimensions, metrics = classify_event(event, dimension_cache)
+    if not metrics:
+        return 0, 0
+
+    count, size = 0, 0
+    for metric_type, metric_list in metrics:
+        populate_payload(metric_type, metric_list, payload, timestamp, dimensions)
+        count += len(metric_list)
+        size += sum(len(metric) for metric, _ in metric_list)
+    return count, size + count * (DATAPOINT_JSON_OVERHEAD + len(dimensions.json))
+
+
+def encode_payload(payload, data_format="json"):
+    """
+    Returns the encoded payload as an iterable of fragments along with its
+    content type
+    """
+    if data_format == "protobuf":
+        return protobuf.iter_datapoints(payload), protobuf.CONTENT_TYPE
+    return iter_json(payload), "application/json"
+
+
+def send_payload(
+    payload,
+    target_url,
+    token,
+    session=None,
+    retry_policy=None,
+    spool=None,
+    data_format="json",
+    compression="gzip",
+    compression_level=DEFAULT_LEVEL,
+    metrics=None,
+):  # pylint: disable=too-many-arguments
+    fragments, content_type = encode_payload(payload, data_format)
+    body, content_encoding = compress(fragments, compression, compression_level, metrics=metrics)
+
+    headers = {"X-SF-TOKEN": token, "Content-Type": content_type}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+
+    return post_with_retry(
+        session or requests,
         target_url,
-        headers={"X-SF-TOKEN": token, "Content-Encoding": "gzip", "Content-Type": "application/json"},
-        data=body.read(),
+        headers=headers,
+        body=body,
+        policy=retry_policy or RetryPolicy(max_attempts=1),
+        spool=spool,
+        metrics=metrics,
     )
-    return resp
 
 
 dispatch(ToSFXCommand, sys.argv, sys.stdin, sys.stdout, __name__)
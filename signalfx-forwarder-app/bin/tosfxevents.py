@@ -1,8 +1,8 @@
-import gzip
+from __future__ import division
+
 import json
 import os
 import sys
-from io import BytesIO
 
 current_path = os.path.dirname(__file__)  # pylint: disable=invalid-name
 sys.path.append(os.path.join(current_path, "libs"))
@@ -17,10 +17,15 @@ from splunklib.searchcommands import (  # isort:skip pylint: disable=import-erro
 )
 
 import requests  # isort:skip
+from sfxlib.compression import DEFAULT_LEVEL, compress  # isort:skip pylint: disable=import-error
+from sfxlib.debuglog import DEFAULT_SAMPLE_EVERY, SampledLog  # isort:skip pylint: disable=import-error
+from sfxlib.forwarder import Forwarder  # isort:skip pylint: disable=import-error
+from sfxlib.retry import RetryPolicy, post_with_retry  # isort:skip pylint: disable=import-error
+from sfxlib.sender import PendingBatch  # isort:skip pylint: disable=import-error
 
 
 @Configuration()
-class ToSFXEventsCommand(EventingCommand):
+class ToSFXEventsCommand(Forwarder, EventingCommand):
     """
     ## Syntax
 
@@ -37,100 +42,140 @@ class ToSFXEventsCommand(EventingCommand):
 
     """
 
-    access_token = None
-    debug = Option(validate=validators.Boolean(), default=False)
-    dry_run = Option(validate=validators.Boolean(), default=False)
-    ingest_url = Option(validate=validators.Match("https://.*", r"^https://.*"))
+    spool_name = "event"
+    size_name = "events"
+    _raw_bytes_limit = None
+    _debug_log = None
+    debug_sample = Option(validate=validators.Integer(minimum=1), default=DEFAULT_SAMPLE_EVERY)
     ev_endpoint = Option(default="/v2/event")
+    batch_size = Option(validate=validators.Integer(minimum=1), default=1000)
+    batch_bytes = Option(validate=validators.Integer(minimum=1), default=1024 * 1024)
 
-    SPLUNK_PASSWORD_REALM = "realm"
-    SPLUNK_PASSWORD_USER_NAME = "username"
-    SPLUNK_PASSWORD_CLEAR_PASSWORD = "clear_password"
-    SPLUNK_KV_STORE_SFX_CONFIG_COLLECTION_NAME = "sfx_ingest_config"
-    SPLUNK_SFX_CONFIG_INGEST_URL_KEY = "ingest_url"
-    SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_REALM = "sfx_ingest_command"
-    SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_USER_NAME = "access_token"
+    @property
+    def endpoint(self):
+        return self.ev_endpoint
 
-    def ensure_default_config(self):
-        if not self.ingest_url:
-            self.ingest_url = self.get_sfx_ingest_url()
+    def transform(self, records):
+        self._debug_log = SampledLog(self.logger, sample_every=self.debug_sample)
+        if self.debug:
+            self._debug_log.start()
+        self._raw_bytes_limit = self.batch_bytes
+        try:
+            for sent in self.forward(records):
+                yield sent
+        finally:
+            self._debug_log.stop()
+
+    def new_batch(self):
+        return EventBatch(debug_log=self._debug_log, keep_events=self.output != "summary")
+
+    def batch_full(self):
+        return len(self._batch.payload) >= self.batch_size or self._batch.size >= self._raw_bytes_limit
+
+    def submit_batch(self, final=False):
+        """
+        Sends the current batch and starts a new one.  `batch_bytes` limits
+        the compressed size of a batch, so the limit on the size of the
+        events before compression follows the compression ratio of the
+        batches sent so far.
+        """
+        batch = self._batch
+        self._batch = None if final else self.new_batch()
+        if not batch.rows:
+            return
+
+        self._metrics.add("rows", batch.rows)
+        self._metrics.add("events", len(batch.payload))
+        if self._sender is None:
+            pending = PendingBatch(batch.payload, batch.events, len(batch.payload), batch.rows)
+            pending.finish()
+        else:
+            pending = self._sender.submit(batch.payload, batch.events, len(batch.payload), batch.rows)
+        self._in_flight.append(pending)
+
+        raw_bytes, compressed_bytes = self._metrics.get("bytes_raw"), self._metrics.get("bytes_compressed")
+        if raw_bytes and compressed_bytes:
+            self._raw_bytes_limit = self.batch_bytes * raw_bytes / compressed_bytes
+
+    def send(self, session, payload):
+        return send_payload(
+            payload=payload,
+            target_url=compose_ingest_url(self.ingest_url, self.ev_endpoint),
+            token=self.access_token,
+            session=session,
+            retry_policy=self._retry_policy,
+            spool=self._spool,
+            compression=self.compression,
+            compression_level=self.compression_level,
+            metrics=self._metrics,
+        )
+
+
+class EventBatch(object):
+    """
+    The JSON encoded events built from a run of consecutive search results,
+    kept alongside the results so that the send status can be attached to
+    them.  Only the number of `rows` is kept unless `keep_events` is set.
+    `size` is the size of the events before compression.
+    """
 
-        self.logger.error("getting access token")
-        self.access_token = self.get_access_token()
+    def __init__(self, debug_log=None, keep_events=True):
+        self.payload = []
+        self.events = []
+        self.rows = 0
+        self.size = 0
+        self.debug_log = debug_log
+        self.keep_events = keep_events
 
-    def get_access_token(self):
-        try:
-            for credential in self.service.storage_passwords:
-                if (
-                    credential.content.get(self.SPLUNK_PASSWORD_REALM, None)
-                    == self.SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_REALM
-                    and credential.content.get(self.SPLUNK_PASSWORD_USER_NAME, None)
-                    == self.SPLUNK_PASSWORDS_STORAGE_SFX_ACCESS_TOKEN_USER_NAME
-                ):
-                    return credential.content.get(self.SPLUNK_PASSWORD_CLEAR_PASSWORD, None)
-        except Exception as e:  # pylint:disable=broad-except
-            self.logger.error("status=error, action=get_sfx_access_token, error_msg=%s", e, exc_info=True)
-        return None
-
-    def get_sfx_ingest_url(self):
-        try:
-            sfx_api_config_collection = self.service.kvstore.get(self.SPLUNK_KV_STORE_SFX_CONFIG_COLLECTION_NAME, None)
-            if sfx_api_config_collection is not None:
-                collection = self.service.kvstore[self.SPLUNK_KV_STORE_SFX_CONFIG_COLLECTION_NAME]
-                # will return a list of settings, we should only have one.
-                # We'll grab the 'last' / most recent one by default
-                sfx_ingest_config_records = collection.data.query()
-                if sfx_ingest_config_records:
-                    sfx_ingest_config_latest = sfx_ingest_config_records[-1]
-                    return sfx_ingest_config_latest.get(self.SPLUNK_SFX_CONFIG_INGEST_URL_KEY, None)
-        except Exception as e:  # pylint:disable=broad-except
-            self.logger.error("status=error, action=get_sfx_ingest_url, error_msg=%s", str(e), exc_info=True)
-        return None
+    def add(self, event):
+        self.size += add_event_to_payload(event=event, payload=self.payload, debug_log=self.debug_log) + 1
+        if self.keep_events:
+            self.events.append(event)
+        self.rows += 1
 
-    def transform(self, records):
-        self.ensure_default_config()
-
-        out = []
-        payload = []
-        for event in records:
-            add_event_to_payload(self, event=event, payload=payload)
-
-            if self.debug:
-                event["endpoint"] = self.ingest_url + self.ev_endpoint
-
-            out.append(event)
-
-        if not self.dry_run:
-            resp = send_payload(
-                payload=payload,
-                target_url=compose_ingest_url(self.ingest_url, self.ev_endpoint),
-                token=self.access_token,
-            )
-            for event in out:
-                event["status"] = resp.status_code
-                if resp.status_code != 200:
-                    event["response_error"] = resp.content
-
-        for event in out:
-            yield event
-
-def send_payload(payload, target_url, token):
-    body = BytesIO()
-    with gzip.GzipFile(fileobj=body, mode="w") as fd:
-        fd.write(json.dumps(payload).encode("utf-8"))
-    body.seek(0)
-
-    resp = requests.post(
+
+def iter_payload(payload):
+    """
+    Yields the JSON array of a list of JSON encoded events one event at a
+    time
+    """
+    separator = "["
+    for event in payload:
+        yield separator + event
+        separator = ","
+    yield "]" if payload else "[]"
+
+def send_payload(
+    payload,
+    target_url,
+    token,
+    session=None,
+    retry_policy=None,
+    spool=None,
+    compression="gzip",
+    compression_level=DEFAULT_LEVEL,
+    metrics=None,
+):  # pylint: disable=too-many-arguments
+    body, content_encoding = compress(iter_payload(payload), compression, compression_level, metrics=metrics)
+
+    headers = {"X-SF-TOKEN": token, "Content-Type": "application/json"}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+
+    return post_with_retry(
+        session or requests,
         target_url,
-        headers={"X-SF-TOKEN": token, "Content-Encoding": "gzip", "Content-Type": "application/json"},
-        data=body.read(),
+        headers=headers,
+        body=body,
+        policy=retry_policy or RetryPolicy(max_attempts=1),
+        spool=spool,
+        metrics=metrics,
     )
-    return resp
 
 def compose_ingest_url(ingest_base_url, ev_endpoint):
     return ingest_base_url.rstrip("/") + ev_endpoint
 
-def add_event_to_payload(self, event, payload):
+def add_event_to_payload(event, payload, debug_log=None):
 
     dimensions = dict()
     properties = dict()
@@ -146,7 +191,6 @@ def add_event_to_payload(self, event, payload):
                 if value[0] != "_" and len(value) < 256:
                     new_key = key.replace("property_", "")
                     new_key = new_key.replace(".", "_")
-                    self.logger.error("KEY is "+str(new_key))
                     properties[new_key] = value
             elif key == "_time":
                 timestamp = int(float(value) * 1000)
@@ -162,9 +206,10 @@ def add_event_to_payload(self, event, payload):
         'eventType': event_type,
     }
 
-    payload.append(event_dict)
-
     event_payload = json.dumps(event_dict)
-    self.logger.error(event_payload)
+    payload.append(event_payload)
+    if debug_log is not None and debug_log.sample():
+        debug_log.logger.debug("action=build_event, event=%s", event_payload)
+    return len(event_payload)
 
 dispatch(ToSFXEventsCommand, sys.argv, sys.stdin, sys.stdout, __name__)
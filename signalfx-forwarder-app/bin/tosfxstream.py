@@ -0,0 +1,74 @@
+import os
+import socket
+import sys
+import time
+from collections import OrderedDict
+
+current_path = os.path.dirname(__file__)  # pylint: disable=invalid-name
+sys.path.append(os.path.join(current_path, "libs"))
+sys.path.append(os.path.join(current_path, "libs", "sfxlib"))
+
+from splunklib.searchcommands import (  # isort:skip pylint: disable=import-error
+    Configuration,
+    StreamingCommand,
+    dispatch,
+)
+
+from tosfx import DatapointForwarder  # isort:skip pylint: disable=import-error
+
+
+@Configuration(lightweight_records=True)
+class ToSFXStreamCommand(DatapointForwarder, StreamingCommand):
+    """
+    ## Syntax
+
+    <command> | tosfxstream
+
+    ## Description
+
+    Generates and sends datapoints the same way as `tosfx`, but as a
+    distributable streaming command.  Each indexer builds and sends the
+    datapoints of its own events, so forwarding throughput scales with the
+    number of indexers rather than being limited to one process on the search
+    head.  Instead of the events, each process running the command returns a
+    single summary result: the `peer` it ran on, the number of `rows`,
+    `datapoints` and `batches` it sent, how many batches failed, and the
+    `status` and `response_error` of the last failure.
+
+    """
+
+    _summary = None
+
+    def stream(self, records):
+        self._summary = OrderedDict(
+            [
+                ("peer", socket.gethostname()),
+                ("rows", 0),
+                ("datapoints", 0),
+                ("batches", 0),
+                ("failed_batches", 0),
+                ("status", 200),
+                ("response_error", ""),
+            ]
+        )
+        for _ in self.forward(records):
+            pass
+        self._summary["_time"] = time.time()
+        yield self._summary
+
+    def batch_results(self, pending):
+        if pending.error is not None:
+            raise pending.error  # pylint: disable=raising-bad-type
+
+        summary = self._summary
+        summary["rows"] += pending.rows
+        summary["datapoints"] += pending.size
+        summary["batches"] += 1
+        if pending.response is not None and pending.response.status_code != 200:
+            summary["failed_batches"] += 1
+            summary["status"] = pending.response.status_code
+            summary["response_error"] = pending.response.content
+        return ()
+
+
+dispatch(ToSFXStreamCommand, sys.argv, sys.stdin, sys.stdout, __name__)
@@ -0,0 +1,30 @@
+"""
+Offline benchmarks for the search commands.  These are run directly, for
+example `python -m tests.benchmarks.payload_bench`, and are not collected by
+pytest.
+"""
+import importlib
+import sys
+import time
+from pathlib import Path
+
+APP_BIN_DIR = Path(__file__).parent.parent.parent.resolve() / "signalfx-forwarder-app" / "bin"
+
+
+def import_command_module(name):
+    """
+    Imports one of the search command scripts from the app's bin directory
+    without dispatching the command.
+    """
+    if str(APP_BIN_DIR) not in sys.path:
+        sys.path.insert(0, str(APP_BIN_DIR))
+    return importlib.import_module(name)
+
+
+def timed(func, *args, **kwargs):
+    """
+    Returns the result of calling `func` along with the elapsed seconds
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
@@ -0,0 +1,79 @@
+"""
+Measures the throughput in MB/s of reading chunked protocol input the way
+splunklib did before, with text mode reads and the CSV parsed from a
+StringIO of each body, against reading it from the binary stream with
+ChunkReader and parsing each body a block at a time.  Reports reading alone
+and reading and parsing, and the peak memory allocated while reading and
+parsing beyond the input itself.
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+from tests.benchmarks import APP_BIN_DIR
+
+
+def make_input(chunks, rows, width):
+    header = ",".join(["_time"] + ["field%d,__mv_field%d" % (i, i) for i in range(width)])
+    lines = [header]
+    for i in range(rows):
+        lines.append(",".join([str(1600000000 + i)] + ["value-%d-%d," % (i % 997, f) for f in range(width)]))
+    body = ("\n".join(lines) + "\n").encode("utf-8")
+    metadata = json.dumps({"action": "execute"}).encode("utf-8")
+    chunk = b"chunked 1.0,%d,%d\n" % (len(metadata), len(body)) + metadata + body
+    return chunk * chunks
+
+
+def read_chunks(search_command, ifile, parse, lines):
+    rows = 0
+    while True:
+        result = search_command.SearchCommand._read_chunk(ifile)
+        if not result:
+            return rows
+        _, body = result
+        if parse:
+            for _ in csv.reader(lines(body), dialect=search_command.CsvDialect):
+                rows += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--width", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(APP_BIN_DIR / "libs"))
+    # pylint: disable=import-error,import-outside-toplevel
+    from splunklib.searchcommands import internals, search_command
+
+    data = make_input(args.chunks, args.rows, args.width)
+    megabytes = len(data) / 2 ** 20
+    readers = [
+        ("text", lambda: io.TextIOWrapper(io.BytesIO(data), encoding="utf-8"), io.StringIO),
+        ("binary", lambda: internals.ChunkReader(io.BufferedReader(io.BytesIO(data))), internals.iter_lines),
+    ]
+
+    print("%.1f MB in %d chunks of %d rows" % (megabytes, args.chunks, args.rows))
+    print("%8s %12s %12s %12s" % ("reader", "read MB/s", "parse MB/s", "peak MB"))
+    for name, open_input, lines in readers:
+        throughput = []
+        for parse in (False, True):
+            start = time.perf_counter()
+            read_chunks(search_command, open_input(), parse, lines)
+            throughput.append(megabytes / (time.perf_counter() - start))
+
+        # Traced separately since tracing slows everything down
+        tracemalloc.start()
+        read_chunks(search_command, open_input(), True, lines)
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        print("%8s %12.1f %12.1f %12.1f" % (name, throughput[0], throughput[1], peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Measures the CPU time to encode and compress a tosfx payload, and the size
+of the resulting body, at each gzip compression level and uncompressed.
+"""
+import argparse
+import time
+
+from tests.benchmarks import import_command_module
+from tests.benchmarks.payload_bench import build_payload, make_events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--format", default="json", choices=("json", "protobuf"))
+    args = parser.parse_args()
+
+    tosfx = import_command_module("tosfx")
+    compression = import_command_module("sfxlib.compression")
+    payload = build_payload(tosfx, make_events(args.events))
+
+    settings = [("none", None)] + [("gzip", level) for level in range(1, 10)]
+
+    print("%d datapoints as %s" % (sum(len(dps) for dps in payload.values()), args.format))
+    print("%12s %10s %14s %8s" % ("compression", "cpu secs", "body bytes", "ratio"))
+    raw_size = None
+    for name, level in settings:
+        start = time.process_time()
+        fragments, _ = tosfx.encode_payload(payload, args.format)
+        body, _ = compression.compress(fragments, name, level)
+        elapsed = time.process_time() - start
+        raw_size = raw_size or len(body)
+        label = name if level is None else "%s-%d" % (name, level)
+        print("%12s %10.2f %14d %8.1f" % (label, elapsed, len(body), raw_size / len(body)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Compares the JSON and protobuf encodings of a tosfx payload: the time to
+encode it and its size on the wire before and after gzip.
+"""
+import argparse
+import gzip
+from collections import OrderedDict
+
+from tests.benchmarks import import_command_module, timed
+from tests.benchmarks.payload_bench import build_payload, make_events
+
+
+def encode(tosfx, payload, data_format):
+    fragments, _ = tosfx.encode_payload(payload, data_format)
+    return b"".join(f if isinstance(f, bytes) else f.encode("utf-8") for f in fragments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200000)
+    args = parser.parse_args()
+
+    tosfx = import_command_module("tosfx")
+    payload = build_payload(tosfx, make_events(args.events))
+    datapoints = sum(len(dps) for dps in payload.values())
+
+    results = OrderedDict()
+    for data_format in ("json", "protobuf"):
+        data, elapsed = timed(encode, tosfx, payload, data_format)
+        results[data_format] = (elapsed, len(data), len(gzip.compress(data)))
+
+    print("%d datapoints" % datapoints)
+    print("%10s %12s %14s %14s" % ("format", "encode secs", "raw bytes", "gzip bytes"))
+    for data_format, (elapsed, raw, compressed) in results.items():
+        print("%10s %12.2f %14d %14d" % (data_format, elapsed, raw, compressed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Times building a single tosfx payload from an increasing number of events.
+Accumulating datapoints is linear in the number of events so the time per
+event should stay flat as the event count grows.
+"""
+import argparse
+from collections import OrderedDict
+
+from tests.benchmarks import import_command_module, timed
+
+
+def make_events(count):
+    return [
+        OrderedDict(
+            [
+                ("_time", str(1600000000 + i)),
+                ("gauge_kb", str(i % 1000)),
+                ("counter_ev", str(i % 7)),
+                ("series", "series-%d" % (i % 50)),
+                ("host", "host-%d" % (i % 10)),
+            ]
+        )
+        for i in range(count)
+    ]
+
+
+def build_payload(tosfx, events):
+    payload = OrderedDict()
+    for event in events:
+        tosfx.add_event_to_payload(event=event, payload=payload)
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="125000,250000,500000,1000000")
+    args = parser.parse_args()
+
+    tosfx = import_command_module("tosfx")
+
+    print("%10s %10s %12s" % ("events", "seconds", "usec/event"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        events = make_events(size)
+        _, elapsed = timed(build_payload, tosfx, events)
+        print("%10d %10.2f %12.2f" % (size, elapsed, elapsed / size * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Runs tosfx and tosfxevents end to end through `SearchCommand.process` with
+synthetic chunked protocol input, sending to the fake ingest backend on
+localhost, and reports rows/s, datapoints/s, peak RSS and the p50/p99 time
+to send a batch for narrow and wide events with low and high cardinality
+dimensions.  Each run is made in a fresh process so that its peak RSS is its
+own.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from tests.benchmarks import import_command_module
+from tests.helpers import fake_backend
+
+COMMANDS = OrderedDict([("tosfx", "ToSFXCommand"), ("tosfxevents", "ToSFXEventsCommand")])
+
+# Number of metric (or property) fields and dimensions of each event
+WIDTHS = OrderedDict([("narrow", (2, 2)), ("wide", (20, 8))])
+
+# Number of distinct values of each dimension
+CARDINALITIES = OrderedDict([("low", 10), ("high", None)])
+
+
+def make_header(command, width):
+    fields, dimensions = WIDTHS[width]
+    if command == "tosfxevents":
+        metrics = ["property_p%d" % i for i in range(fields)]
+        return ["_time", "event_type"] + metrics + ["dim%d" % i for i in range(dimensions)]
+    metrics = ["gauge_g%d" % i if i % 2 == 0 else "counter_c%d" % i for i in range(fields)]
+    return ["_time"] + metrics + ["dim%d" % i for i in range(dimensions)]
+
+
+def make_rows(header, rows, cardinality):
+    for i in range(rows):
+        key = i if cardinality is None else i % cardinality
+        row = []
+        for field in header:
+            if field == "_time":
+                row.append(str(1600000000 + i // 100))
+            elif field == "event_type":
+                row.append("benchmark")
+            elif field.startswith("dim"):
+                row.append("%s-%d" % (field, key))
+            else:
+                row.append(str(i % 1000))
+        yield ",".join(row)
+
+
+def make_chunks(args, header, rows, chunk_size):
+    """
+    Yields the transport header and payload of each chunk Splunk would send:
+    the getinfo chunk followed by execute chunks of `chunk_size` rows.
+    """
+    searchinfo = {
+        "args": args,
+        "raw_args": args,
+        "dispatch_dir": tempfile.gettempdir(),
+        "sid": "benchmark",
+        "app": "signalfx-forwarder-app",
+        "owner": "admin",
+        "username": "admin",
+        "session_key": "benchmark",
+        "splunk_uri": "https://127.0.0.1:8089",
+        "splunk_version": "8.0.0",
+        "earliest_time": "0",
+        "latest_time": "0",
+        "search": "| benchmark",
+    }
+    metadata = json.dumps({"action": "getinfo", "preview": False, "searchinfo": searchinfo})
+    yield "chunked 1.0,%d,0\n" % len(metadata), metadata
+
+    lines = []
+    for line in rows:
+        lines.append(line)
+        if len(lines) == chunk_size:
+            metadata = json.dumps({"action": "execute"})
+            body = "\n".join([",".join(header)] + lines) + "\n"
+            yield "chunked 1.0,%d,%d\n" % (len(metadata), len(body)), metadata + body
+            lines = []
+    metadata = json.dumps({"action": "execute", "finished": True})
+    body = "\n".join([",".join(header)] + lines) + "\n" if lines else ""
+    yield "chunked 1.0,%d,%d\n" % (len(metadata), len(body)), metadata + body
+
+
+class ChunkedInput(object):
+    """
+    Serves chunks to `SearchCommand.process` as they are read so that the
+    whole input never has to be held in memory.  The synthetic data is ASCII,
+    so the lengths in the transport headers are also character counts.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._current = io.StringIO()
+
+    def readline(self):
+        for header, payload in self._chunks:
+            self._current = io.StringIO(payload)
+            return header
+        return ""
+
+    def read(self, size=-1):
+        return self._current.read(size)
+
+
+class DiscardedOutput(io.RawIOBase):
+    """
+    Counts and drops what the command writes back to Splunk.
+    """
+
+    size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.size += len(b)
+        return len(b)
+
+
+def instrument(command_class, ingest_url, latencies):
+    """
+    Returns a subclass of `command_class` that sends to `ingest_url` without
+    looking anything up from splunkd and adds the seconds taken to send each
+    batch, retries included, to `latencies`.
+    """
+    config_cache = import_command_module("sfxlib.config_cache")
+
+    class Benchmarked(command_class):
+        def ensure_default_config(self):
+            self._config_cache = config_cache.ConfigCache(
+                str(Path(tempfile.gettempdir()) / "process_bench_cache.json"), ttl=0
+            )
+            # Set the option's backing field directly since the option only accepts https URLs
+            self._ingest_url = ingest_url  # pylint: disable=attribute-defined-outside-init
+            self.access_token = "benchmark"
+
+        def post_payload(self, session, payload):
+            start = time.perf_counter()
+            try:
+                return super().post_payload(session, payload)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    Benchmarked.__name__ = command_class.__name__
+    return Benchmarked
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run(command, width, cardinality, rows, chunk_size, ingest_url, args):
+    """
+    Runs `command` over `rows` synthetic events and returns its elapsed
+    seconds, the time to send each batch and the peak RSS of the process in
+    bytes.
+    """
+    module = import_command_module(command)
+    # Spool requests the fake backend fails to a directory of the run rather than the Splunk installation's
+    import_command_module("sfxlib.forwarder").SPOOL_DIR = tempfile.mkdtemp(prefix="process_bench_spool")
+    latencies = []
+    command_class = instrument(getattr(module, COMMANDS[command]), ingest_url, latencies)
+
+    header = make_header(command, width)
+    chunks = make_chunks(args, header, make_rows(header, rows, CARDINALITIES[cardinality]), chunk_size)
+
+    start = time.perf_counter()
+    try:
+        command_class().process([command] + args, ChunkedInput(chunks), DiscardedOutput())
+    except SystemExit:
+        # process() exits when the command fails, which would leave the pool waiting on a dead worker
+        raise RuntimeError("%s failed, see the error above" % command)
+    elapsed = time.perf_counter() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes except on macOS
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+    return elapsed, latencies, peak_rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--commands", default=",".join(COMMANDS))
+    parser.add_argument("--widths", default=",".join(WIDTHS))
+    parser.add_argument("--cardinalities", default=",".join(CARDINALITIES))
+    parser.add_argument("--args", default="", help="extra command arguments, e.g. 'concurrency=4 format=protobuf'")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("fork")
+    print(
+        "%12s %7s %5s %9s %10s %12s %8s %8s %10s %10s"
+        % ("command", "width", "card", "rows", "rows/s", "datapoints/s", "batches", "rss MB", "p50 ms", "p99 ms")
+    )
+    with fake_backend.start() as backend:
+        for command in args.commands.split(","):
+            for width in args.widths.split(","):
+                for cardinality in args.cardinalities.split(","):
+                    backend.reset_datapoints()
+                    backend.reset_events()
+                    with context.Pool(1) as pool:
+                        elapsed, latencies, peak_rss = pool.apply(
+                            run,
+                            (command, width, cardinality, args.rows, args.chunk_size)
+                            + (backend.ingest_url, args.args.split()),
+                        )
+                    datapoints = len(backend.datapoints) + len(backend.events)
+                    print(
+                        "%12s %7s %5s %9d %10.0f %12.0f %8d %8.1f %10.2f %10.2f"
+                        % (
+                            command,
+                            width,
+                            cardinality,
+                            args.rows,
+                            args.rows / elapsed,
+                            datapoints / elapsed,
+                            len(latencies),
+                            peak_rss / 2 ** 20,
+                            percentile(latencies, 0.5) * 1000,
+                            percentile(latencies, 0.99) * 1000,
+                        )
+                    )
+
+
+if __name__ == "__main__":
+    main()
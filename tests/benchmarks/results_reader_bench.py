@@ -0,0 +1,142 @@
+"""
+Measures the throughput in MB/s of splunklib's ResultsReader over a
+synthetic XML export stream: a sequence of results documents, each with its
+own XML declaration, as search/jobs/export returns them.  Reports the DTD
+filter alone and the whole reader, and the filter splunklib used before,
+which read one byte at a time, over a smaller stream for comparison.  The
+same results are also exported as JSON, one result per line, and read with
+JSONResultsReader.
+"""
+import argparse
+import json
+import sys
+import time
+
+from tests.benchmarks import APP_BIN_DIR
+
+DOCUMENT_HEADER = (
+    b"<?xml version='1.0' encoding='UTF-8'?>\n<results preview='0'>\n<meta><fieldOrder>%s</fieldOrder></meta>\n"
+)
+
+
+def make_document(results, width):
+    fields = ["_time"] + ["field%d" % i for i in range(width)]
+    header = DOCUMENT_HEADER % "".join("<field>%s</field>" % f for f in fields).encode("utf-8")
+    body = []
+    for offset in range(results):
+        values = ["<field k='_time'><value><text>%d</text></value></field>" % (1600000000 + offset)]
+        values += [
+            "<field k='field%d'><value><text>value-%d-%d</text></value></field>" % (f, offset, f) for f in range(width)
+        ]
+        body.append("<result offset='%d'>%s</result>\n" % (offset, "".join(values)))
+    return header + "".join(body).encode("utf-8") + b"</results>\n"
+
+
+def make_json_document(results, width):
+    lines = []
+    for offset in range(results):
+        result = {"_time": str(1600000000 + offset)}
+        result.update(("field%d" % f, "value-%d-%d" % (offset, f)) for f in range(width))
+        line = {"preview": False, "offset": offset, "result": result}
+        if offset == results - 1:
+            line["lastrow"] = True
+        lines.append(json.dumps(line) + "\n")
+    return "".join(lines).encode("utf-8")
+
+
+class SyntheticStream(object):
+    """
+    Repeats `document` until at least `size` bytes have been read, so that
+    the whole stream never has to be held in memory.
+    """
+
+    def __init__(self, document, size):
+        self._document = document
+        self._remaining = -(-size // len(document)) * len(document)
+        self._offset = 0
+        self.size = self._remaining
+
+    def read(self, n=None):
+        if n is None or n < 0:
+            n = self._remaining
+        n = min(n, self._remaining)
+        parts = []
+        while n > 0:
+            part = self._document[self._offset : self._offset + n]
+            self._offset = (self._offset + len(part)) % len(self._document)
+            self._remaining -= len(part)
+            n -= len(part)
+            parts.append(part)
+        return b"".join(parts)
+
+
+class ByteAtATimeFilter(object):
+    """
+    The DTD filter splunklib used before, which reads and appends one byte
+    at a time.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, n=None):
+        response = b""
+        while n is None or n > 0:
+            c = self.stream.read(1)
+            if c == b"":
+                break
+            if c == b"<":
+                c += self.stream.read(1)
+                if c == b"<?":
+                    while self.stream.read(1) not in (b">", b""):
+                        pass
+                    continue
+            response += c
+            if n is not None:
+                n -= len(c)
+        return response
+
+
+def drain(stream, block_size=16 * 1024):
+    while stream.read(block_size):
+        pass
+
+
+def count(reader):
+    return sum(1 for _ in reader)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megabytes", type=int, default=500)
+    parser.add_argument("--baseline-megabytes", type=int, default=5)
+    parser.add_argument("--results", type=int, default=100, help="results per document")
+    parser.add_argument("--width", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(APP_BIN_DIR / "libs"))
+    from splunklib import results  # pylint: disable=import-error,import-outside-toplevel
+
+    document = make_document(args.results, args.width)
+    json_document = make_json_document(args.results, args.width)
+    runs = [
+        ("byte filter", document, args.baseline_megabytes, lambda stream: drain(ByteAtATimeFilter(stream))),
+        ("block filter", document, args.megabytes, lambda stream: drain(results._XMLDTDFilter(stream))),
+        ("xml reader", document, args.megabytes, lambda stream: count(results.ResultsReader(stream))),
+        ("json reader", json_document, args.megabytes, lambda stream: count(results.JSONResultsReader(stream))),
+    ]
+
+    print("%d byte XML and %d byte JSON documents of %d results" % (len(document), len(json_document), args.results))
+    print("%14s %8s %10s %12s" % ("run", "MB", "MB/s", "results/s"))
+    for name, data, megabytes, consume in runs:
+        stream = SyntheticStream(data, megabytes * 2 ** 20)
+        size = stream.size / 2 ** 20
+        start = time.perf_counter()
+        consume(stream)
+        elapsed = time.perf_counter() - start
+        parsed = stream.size // len(data) * args.results
+        print("%14s %8.1f %10.1f %12.0f" % (name, size, size / elapsed, parsed / elapsed))
+
+
+if __name__ == "__main__":
+    main()
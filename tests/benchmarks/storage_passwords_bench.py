@@ -0,0 +1,183 @@
+"""
+Measures how long splunklib takes to list the stored passwords of an app,
+the lookup `get_access_token` falls back to, when splunkd answers in Atom and
+when it answers in JSON, and when the JSON is loaded a page at a time:
+serially, with pages prefetched by `iter`, and with pages loaded concurrently
+by `list`.  splunkd is stood in for by a request handler that answers from
+canned entries after `--latency-ms`, so only the round trips and reading the
+entities are timed, along with `--consume-us` spent on each entity by the
+caller, which is what prefetching overlaps with.
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+from tests.benchmarks import APP_BIN_DIR
+
+APP = "signalfx-forwarder-app"
+ACL = {
+    "app": APP,
+    "can_change_perms": True,
+    "can_list": True,
+    "can_share_app": True,
+    "can_share_global": True,
+    "can_share_user": False,
+    "can_write": True,
+    "modifiable": True,
+    "owner": "nobody",
+    "perms": {"read": ["*"], "write": ["admin", "power"]},
+    "removable": True,
+    "sharing": "app",
+}
+LINKS = [("alternate", ""), ("list", ""), ("edit", ""), ("remove", "")]
+
+
+def make_passwords(count):
+    for i in range(count):
+        realm, username = "realm%d" % (i % 10), "user%d" % i
+        name = "%s:%s:" % (realm, username)
+        yield name, {
+            "clear_password": "secret-%d" % i,
+            "encr_password": "$7$%064d" % i,
+            "password": "********",
+            "realm": realm,
+            "username": username,
+        }
+
+
+def atom_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, dict):
+        keys = ['<s:key name="%s">%s</s:key>' % (k, atom_value(v)) for k, v in value.items()]
+        return "<s:dict>%s</s:dict>" % "".join(keys)
+    if isinstance(value, list):
+        return "<s:list>%s</s:list>" % "".join("<s:item>%s</s:item>" % escape(v) for v in value)
+    return escape(value)
+
+
+def make_atom_entries(passwords):
+    entries = []
+    for name, content in passwords:
+        path = "/servicesNS/nobody/%s/storage/passwords/%s" % (APP, name.replace(":", "%3A"))
+        links = "".join('<link href="%s%s" rel="%s"/>' % (path, suffix, rel) for rel, suffix in LINKS)
+        content = dict(content, **{"eai:acl": ACL})
+        entries.append(
+            "<entry><title>%s</title><id>https://127.0.0.1:8089%s</id><updated>1970-01-01T00:00:00+00:00</updated>"
+            '%s<author><name>nobody</name></author><content type="text/xml">%s</content></entry>'
+            % (escape(name), path, links, atom_value(content))
+        )
+    return entries
+
+
+def make_json_entries(passwords):
+    entries = []
+    for name, content in passwords:
+        path = "/servicesNS/nobody/%s/storage/passwords/%s" % (APP, name.replace(":", "%3A"))
+        entry = json.dumps(
+            {
+                "name": name,
+                "id": "https://127.0.0.1:8089" + path,
+                "updated": "1970-01-01T00:00:00+00:00",
+                "links": dict((rel, path + suffix) for rel, suffix in LINKS),
+                "author": "nobody",
+                "acl": ACL,
+                "fields": {"required": [], "optional": [], "wildcard": []},
+                "content": dict(content, **{"eai:acl": None}),
+            }
+        )
+        entries.append(entry)
+    return entries
+
+
+def canned_handler(atom_entries, json_entries, latency):
+    """
+    Returns a splunklib request handler that answers each request for a
+    page of the stored passwords, in Atom or in JSON as asked, after
+    `latency` seconds.
+    """
+
+    def request(url, message, **kwargs):  # pylint: disable=unused-argument
+        query = parse_qs(urlsplit(url).query)
+        offset = int(query.get("offset", ["0"])[0])
+        count = int(query.get("count", ["-1"])[0])
+        stop = len(json_entries) if count <= 0 else offset + count
+        if query.get("output_mode") == ["json"]:
+            content_type = "application/json; charset=UTF-8"
+            body = '{"entry":[%s],"paging":{"total":%d,"offset":%d},"messages":[]}' % (
+                ",".join(json_entries[offset:stop]),
+                len(json_entries),
+                offset,
+            )
+        else:
+            content_type = "text/xml; charset=UTF-8"
+            body = (
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:s="http://dev.splunk.com/ns/rest" '
+                'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"><title>passwords</title>'
+                "<opensearch:totalResults>%d</opensearch:totalResults><s:messages/>%s</feed>"
+                % (len(atom_entries), "".join(atom_entries[offset:stop]))
+            )
+        time.sleep(latency)
+        headers = [("Content-Type", content_type)]
+        return {"status": 200, "reason": "OK", "headers": headers, "body": io.BytesIO(body.encode("utf-8"))}
+
+    return request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--passwords", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pagesize", type=int, default=500)
+    parser.add_argument("--prefetch", type=int, default=2, help="pages iter loads ahead")
+    parser.add_argument("--concurrency", type=int, default=4, help="pages list loads at once")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--consume-us", type=float, default=50)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(APP_BIN_DIR / "libs"))
+    from splunklib import client  # pylint: disable=import-error,import-outside-toplevel
+
+    passwords = list(make_passwords(args.passwords))
+    handler = canned_handler(make_atom_entries(passwords), make_json_entries(passwords), args.latency_ms / 1000)
+    runs = [
+        ("xml", "xml", lambda passwords: passwords.list()),
+        ("json", "json", lambda passwords: passwords.list()),
+        ("json paged", "json", lambda passwords: passwords.iter(pagesize=args.pagesize)),
+        ("json prefetch", "json", lambda passwords: passwords.iter(pagesize=args.pagesize, prefetch=args.prefetch)),
+        (
+            "json parallel",
+            "json",
+            lambda passwords: passwords.list(pagesize=args.pagesize, concurrency=args.concurrency),
+        ),
+    ]
+
+    listed = {}
+    print("%14s %10s %12s" % ("run", "seconds", "entities/s"))
+    for name, output_mode, list_passwords in runs:
+        service = client.Service(handler=handler, token="benchmark", owner="nobody", app=APP)
+        service.entity_output_mode = output_mode
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            entities = []
+            for entity in list_passwords(service.storage_passwords):
+                time.sleep(args.consume_us / 10 ** 6)
+                entities.append(entity)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        listed[name] = [(e.name, dict(e.content), dict(e.access), e.links.alternate) for e in entities]
+        print("%14s %10.3f %12.0f" % (name, best, len(entities) / best))
+
+    for name in listed:
+        if listed[name] != listed["xml"]:
+            raise RuntimeError("The passwords listed by the %s run differ from those listed from Atom" % name)
+
+
+if __name__ == "__main__":
+    main()
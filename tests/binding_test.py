@@ -0,0 +1,129 @@
+"""
+Tests for the keep-alive request handler added to the splunklib vendored in
+signalfx-forwarder-app/bin/libs, against a local HTTP server.
+"""
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+APP_LIBS_DIR = Path(__file__).parent.parent.resolve() / "signalfx-forwarder-app" / "bin" / "libs"
+sys.path.insert(0, str(APP_LIBS_DIR))
+
+# pylint: disable=wrong-import-position,import-error
+from splunklib import binding  # noqa: E402
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """
+    Answers `/ok` and keeps the connection open, `/hangup` and then closes
+    the connection without saying so, as splunkd does with idle connections,
+    and `/slow` after half a second.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.server.requests[self.path] += 1
+        self.server.connections.add(self.client_address)
+        if self.path == "/slow":
+            time.sleep(0.5)
+        body = self.path.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = self.path == "/hangup"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture(name="server")
+def fixture_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    server.daemon_threads = True
+    server.requests = Counter()
+    server.connections = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(request, server, path):
+    response = request("http://127.0.0.1:%d%s" % (server.server_address[1], path), {"headers": []})
+    return response["status"], response["body"].read()
+
+
+def test_pooled_handler_returns_connections_to_the_pool(server):
+    request = binding.pooled_handler()
+
+    assert [get(request, server, "/ok") for _ in range(3)] == [(200, b"/ok")] * 3
+    assert server.requests["/ok"] == 3
+    assert len(server.connections) == 1
+
+
+def test_pooled_handler_keeps_a_connection_until_its_body_is_read(server):
+    request = binding.pooled_handler()
+    url = "http://127.0.0.1:%d/ok" % server.server_address[1]
+
+    unread = request(url, {"headers": []})
+    assert get(request, server, "/ok") == (200, b"/ok")
+    assert len(server.connections) == 2
+
+    unread["body"].read()
+    for _ in range(2):
+        get(request, server, "/ok")
+    assert len(server.connections) == 2
+
+
+def test_pooled_handler_resends_on_a_connection_closed_by_the_server(server):
+    request = binding.pooled_handler()
+
+    assert get(request, server, "/hangup") == (200, b"/hangup")
+    # Give the server time to close its end
+    time.sleep(0.1)
+    assert get(request, server, "/ok") == (200, b"/ok")
+    assert server.requests == {"/hangup": 1, "/ok": 1}
+    assert len(server.connections) == 2
+
+
+def test_pooled_handler_does_not_resend_after_a_timeout(server):
+    request = binding.pooled_handler(timeout=0.1)
+
+    get(request, server, "/ok")
+    with pytest.raises(socket.timeout):
+        get(request, server, "/slow")
+    time.sleep(0.5)
+    assert server.requests["/slow"] == 1
+
+
+def test_pooled_handler_does_not_resend_on_a_new_connection():
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    accepted = []
+
+    def hang_up():
+        connection, _ = listener.accept()
+        accepted.append(connection)
+        connection.recv(65536)
+        connection.close()
+
+    thread = threading.Thread(target=hang_up, daemon=True)
+    thread.start()
+    request = binding.pooled_handler(timeout=1)
+    try:
+        with pytest.raises(binding.six.moves.http_client.RemoteDisconnected):
+            request("http://127.0.0.1:%d/ok" % listener.getsockname()[1], {"headers": []})
+        thread.join()
+    finally:
+        listener.close()
+    assert len(accepted) == 1
@@ -0,0 +1,227 @@
+"""
+Tests for the changes to splunklib.client vendored in
+signalfx-forwarder-app/bin/libs: reading entities from JSON as well as Atom and
+loading collections a page at a time, against canned splunkd responses.
+"""
+import io
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+APP_LIBS_DIR = Path(__file__).parent.parent.resolve() / "signalfx-forwarder-app" / "bin" / "libs"
+sys.path.insert(0, str(APP_LIBS_DIR))
+
+# pylint: disable=wrong-import-position,import-error
+from splunklib import client  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "client"
+APP = "signalfx-forwarder-app"
+CONTENT_TYPES = {"json": "application/json; charset=UTF-8", "xml": "text/xml; charset=UTF-8"}
+
+
+def fixture_service(fixture, output_mode):
+    """
+    Returns a service that reads entities in `output_mode` and that splunkd
+    answers with the fixture of that name, in JSON or in Atom as asked
+    """
+    requests = []
+
+    def request(url, message, **kwargs):  # pylint: disable=unused-argument
+        query = parse_qs(urlsplit(url).query)
+        requests.append(query)
+        extension = "json" if query.get("output_mode") == ["json"] else "xml"
+        body = (FIXTURES_DIR / ("%s.%s" % (fixture, extension))).read_bytes()
+        headers = [("Content-Type", CONTENT_TYPES[extension])]
+        return {"status": 200, "reason": "OK", "headers": headers, "body": io.BytesIO(body)}
+
+    service = client.Service(handler=request, token="test", owner="nobody", app=APP)
+    service.entity_output_mode = output_mode
+    service.requests = requests
+    return service
+
+
+@pytest.mark.parametrize("output_mode", ["xml", "json"])
+def test_entities_are_read_in_the_service_output_mode(output_mode):
+    service = fixture_service("storage_passwords", output_mode)
+
+    service.storage_passwords.list()
+
+    expected = ["json"] if output_mode == "json" else None
+    assert [query.get("output_mode") for query in service.requests] == [expected]
+
+
+def test_json_and_atom_entities_match():
+    listed = {}
+    for output_mode in ("xml", "json"):
+        passwords = fixture_service("storage_passwords", output_mode).storage_passwords
+        listed[output_mode] = [(entity.name, entity.state) for entity in passwords.list()]
+        listed[output_mode].append(("get", passwords["sfx_ingest_command:access_token:"].state))
+
+    assert listed["json"] == listed["xml"]
+
+
+@pytest.mark.parametrize("output_mode", ["xml", "json"])
+def test_entity_state_from_fixture(output_mode):
+    path = "/servicesNS/nobody/signalfx-forwarder-app/storage/passwords/sfx_ingest_command%3Aaccess_token%3A"
+
+    (entity,) = fixture_service("storage_passwords", output_mode).storage_passwords.list()
+
+    assert entity.name == "sfx_ingest_command:access_token:"
+    assert entity.links.alternate == path
+    assert entity.access.owner == "nobody"
+    assert entity.access.can_share_user == "0" and entity.access.removable == "1"
+    assert entity.access.perms == {"read": ["*"], "write": ["admin", "power"]}
+    assert entity.fields == {"required": ["name", "password"], "optional": ["password", "realm"], "wildcard": []}
+    assert entity.content.clear_password == "secret-token"
+    assert "eai:acl" not in entity.content and "eai:attributes" not in entity.content
+
+    entity.refresh()
+    assert entity["clear_password"] == "secret-token"
+    assert entity.links["alternate"] == path
+
+
+@pytest.mark.parametrize("output_mode", ["xml", "json"])
+def test_empty_collection_from_fixture(output_mode):
+    passwords = fixture_service("storage_passwords_empty", output_mode).storage_passwords
+
+    assert passwords.list() == []
+    assert list(passwords.iter(pagesize=10)) == []
+    with pytest.raises(KeyError):
+        passwords["sfx_ingest_command:access_token:"]  # pylint: disable=pointless-statement
+
+
+def paged_service(total, with_total=True, latency=0.0):
+    """
+    Returns a service that reads entities in JSON from a collection of
+    `total` saved searches that splunkd answers a page at a time, with the
+    total in the paging metadata when `with_total` is set.  Later pages are
+    answered sooner so that pages loaded at once finish out of order.
+    """
+    requests = []
+    lock = threading.Lock()
+
+    def request(url, message, **kwargs):  # pylint: disable=unused-argument
+        query = parse_qs(urlsplit(url).query)
+        offset = int(query.get("offset", ["0"])[0])
+        count = int(query.get("count", ["0"])[0])
+        with lock:
+            requests.append((offset, count))
+        stop = total if count <= 0 else min(total, offset + count)
+        entries = [
+            {
+                "name": "search%02d" % i,
+                "links": {"alternate": "/servicesNS/nobody/%s/saved/searches/search%02d" % (APP, i)},
+                "content": {"n": i},
+            }
+            for i in range(offset, stop)
+        ]
+        document = {"entry": entries, "messages": []}
+        if with_total:
+            document["paging"] = {"total": total, "perPage": count, "offset": offset}
+        time.sleep(latency * max(0, total - offset))
+        headers = [("Content-Type", CONTENT_TYPES["json"])]
+        return {"status": 200, "reason": "OK", "headers": headers, "body": io.BytesIO(json.dumps(document).encode())}
+
+    service = client.Service(handler=request, token="test", owner="nobody", app=APP)
+    service.entity_output_mode = "json"
+    service.requests = requests
+    return service
+
+
+def names(entities):
+    return [entity.name for entity in entities]
+
+
+def test_prefetch_yields_items_in_order():
+    def slow():
+        for i in range(5):
+            time.sleep(0.01)
+            yield i
+
+    assert list(client._prefetch(slow(), 2)) == [0, 1, 2, 3, 4]  # pylint: disable=protected-access
+    assert list(client._prefetch(iter([]), 1)) == []  # pylint: disable=protected-access
+
+
+def test_prefetch_raises_the_error_of_the_iterable():
+    def failing():
+        yield 1
+        raise ValueError("page failed")
+
+    prefetched = client._prefetch(failing(), 1)  # pylint: disable=protected-access
+    assert next(prefetched) == 1
+    with pytest.raises(ValueError, match="page failed"):
+        next(prefetched)
+
+
+def test_prefetch_stops_loading_when_the_caller_stops():
+    loaded = []
+
+    def pages():
+        for i in range(100):
+            loaded.append(i)
+            yield i
+
+    prefetched = client._prefetch(pages(), 1)  # pylint: disable=protected-access
+    assert next(prefetched) == 0
+    prefetched.close()
+    time.sleep(0.3)
+    assert len(loaded) < 5
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_iter_pages_loads_pages_in_order(prefetch):
+    service = paged_service(10)
+    searches = client.Collection(service, "saved/searches")
+
+    pages = list(searches._iter_pages(0, None, 3))  # pylint: disable=protected-access
+    assert [names(page) for page in pages] == [
+        ["search00", "search01", "search02"],
+        ["search03", "search04", "search05"],
+        ["search06", "search07", "search08"],
+        ["search09"],
+    ]
+    assert names(searches.iter(pagesize=3, prefetch=prefetch)) == ["search%02d" % i for i in range(10)]
+
+
+@pytest.mark.parametrize("with_total", [True, False])
+def test_list_concurrently_keeps_page_order(with_total):
+    service = paged_service(20, with_total=with_total, latency=0.002)
+
+    listed = client.Collection(service, "saved/searches").list(pagesize=3, concurrency=4)
+
+    assert names(listed) == ["search%02d" % i for i in range(20)]
+    assert sorted(service.requests) == [(offset, 3) for offset in range(0, 20, 3)]
+
+
+def test_list_concurrently_with_total_smaller_than_pagesize():
+    service = paged_service(2)
+
+    listed = client.Collection(service, "saved/searches").list(pagesize=5, concurrency=4)
+
+    assert names(listed) == ["search00", "search01"]
+    assert service.requests == [(0, 5)]
+
+
+@pytest.mark.parametrize(
+    "offset,count",
+    [(0, None), (0, 0), (0, 1), (0, 3), (0, 10), (0, 25), (2, 3), (2, 4), (3, 7), (9, 5), (10, 5), (12, 3)],
+)
+@pytest.mark.parametrize("load", ["iter", "prefetch", "concurrently"])
+def test_paging_honors_offset_and_count(offset, count, load):
+    service = paged_service(10)
+    searches = client.Collection(service, "saved/searches")
+
+    if load == "concurrently":
+        listed = searches.list(offset=offset, count=count, pagesize=3, concurrency=4)
+    else:
+        listed = list(searches.iter(offset=offset, count=count, pagesize=3, prefetch=2 if load == "prefetch" else 0))
+
+    stop = None if count is None else offset + count
+    assert names(listed) == ["search%02d" % i for i in range(10)][offset:stop]
+    # A count of 0 would ask splunkd for everything
+    assert all(0 < page_count <= 3 for _, page_count in service.requests)
@@ -0,0 +1,287 @@
+"""
+Runs the search commands in signalfx-forwarder-app/bin through
+`SearchCommand.process` with chunked protocol input, as Splunk would, without
+looking anything up from splunkd.
+"""
+import csv
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+APP_BIN_DIR = Path(__file__).parent.parent.resolve() / "signalfx-forwarder-app" / "bin"
+sys.path.insert(0, str(APP_BIN_DIR))
+
+# pylint: disable=wrong-import-position,import-error
+import tosfx  # noqa: E402
+import tosfxevents  # noqa: E402
+from sfxlib import forwarder  # noqa: E402
+from sfxlib.config_cache import ConfigCache  # noqa: E402
+
+SEARCHINFO = {
+    "dispatch_dir": tempfile.gettempdir(),
+    "sid": "test",
+    "app": "signalfx-forwarder-app",
+    "owner": "admin",
+    "username": "admin",
+    "session_key": "test",
+    "splunk_uri": "https://127.0.0.1:8089",
+    "splunk_version": "8.0.0",
+    "earliest_time": "0",
+    "latest_time": "0",
+    "search": "| test",
+}
+
+
+def make_input(args, header, chunks):
+    """
+    Returns the getinfo chunk Splunk would send followed by an execute chunk
+    for each list of `chunks`, the last one marked finished.
+    """
+    searchinfo = dict(SEARCHINFO, args=args, raw_args=args)
+    metadata = json.dumps({"action": "getinfo", "preview": False, "searchinfo": searchinfo})
+    parts = ["chunked 1.0,%d,0\n%s" % (len(metadata), metadata)]
+    for i, rows in enumerate(chunks):
+        metadata = json.dumps({"action": "execute", "finished": i == len(chunks) - 1})
+        body = "\n".join([",".join(header)] + [",".join(row) for row in rows]) + "\n"
+        parts.append("chunked 1.0,%d,%d\n%s%s" % (len(metadata), len(body), metadata, body))
+    return io.BytesIO("".join(parts).encode("utf-8"))
+
+
+def read_chunks(data):
+    """
+    Returns the metadata and the records of each chunk the command wrote back
+    """
+    chunks = []
+    while data:
+        # splunklib ends the getinfo chunk with a newline that isn't counted in its length
+        start_line, data = data.lstrip(b"\n").split(b"\n", 1)
+        metadata_length, body_length = (int(n) for n in start_line.split(b",")[1:])
+        metadata = json.loads(data[:metadata_length].decode("utf-8")) if metadata_length else {}
+        body = data[metadata_length : metadata_length + body_length].decode("utf-8")
+        data = data[metadata_length + body_length :]
+        chunks.append((metadata, list(csv.DictReader(io.StringIO(body))) if body else []))
+    return chunks
+
+
+def read_output(data):
+    """
+    Returns the records of each chunk the command wrote back
+    """
+    return [records for _, records in read_chunks(data)]
+
+
+def offline(command_class, ingest_url="http://127.0.0.1:1"):
+    """
+    Returns a subclass of `command_class` configured without splunkd to send
+    to `ingest_url`
+    """
+
+    class Offline(command_class):
+        def ensure_default_config(self):
+            self._config_cache = ConfigCache(str(Path(tempfile.mkdtemp()) / "cache.json"), ttl=0)
+            # Set the option's backing field directly since the option only accepts https URLs
+            self._ingest_url = ingest_url  # pylint: disable=attribute-defined-outside-init
+            self.access_token = "test"
+
+    Offline.__name__ = command_class.__name__
+    return Offline
+
+
+def recording(command_class, posts, statuses=()):
+    """
+    Returns a subclass of `command_class` configured without splunkd that
+    appends each payload it is asked to send to `posts` instead of sending it.
+    Payloads are answered with the given `statuses` in turn, then with 200.
+    """
+    statuses = list(statuses)
+
+    class Recording(offline(command_class)):
+        def send(self, session, payload):
+            posts.append(payload)
+            status = statuses.pop(0) if statuses else 200
+            return SimpleNamespace(status_code=status, content=b"" if status == 200 else b"bad", request=None)
+
+    Recording.__name__ = command_class.__name__
+    return Recording
+
+
+# The rows of each chunk, fewer than a batch, so that batches are only cut when a chunk has been read
+CHUNK_SIZES = [3, 2, 1]
+COMMAND_ROWS = {
+    "tosfx": (["_time", "host", "gauge_kb"], lambda i: ["1600000005", "h%d" % i, str(i)]),
+    "tosfxevents": (
+        ["_time", "event_type", "property_v", "host"],
+        lambda i: ["1600000005", "deploy", "v%d" % i, "h%d" % i],
+    ),
+}
+COMMANDS = {"tosfx": tosfx.ToSFXCommand, "tosfxevents": tosfxevents.ToSFXEventsCommand}
+
+
+def chunked_rows(command):
+    header, row = COMMAND_ROWS[command]
+    rows = iter(range(sum(CHUNK_SIZES)))
+    return header, [[row(next(rows)) for _ in range(size)] for size in CHUNK_SIZES]
+
+
+def sent_batches(command_class, command, args):
+    header, chunks = chunked_rows(command)
+    output = run(command_class, args + ["output=summary"], header, chunks)
+    size_name = "events" if command == "tosfxevents" else "datapoints"
+    return [
+        (summary["batch"], summary["rows"], summary[size_name], summary["status"])
+        for chunk in output[1:]
+        for summary in chunk
+    ]
+
+
+def run(command_class, args, header, chunks):
+    output = io.BytesIO()
+    command_class().process(["test"], make_input(args, header, chunks), output)
+    return read_output(output.getvalue())
+
+
+def test_tosfx_sends_a_rolled_up_bucket_larger_than_a_batch():
+    rows = [["1600000005", "dim-%d" % i, str(i)] for i in range(300)]
+    args = ["dry_run=true", "rollup=10", "batch_size=100", "output=summary"]
+
+    chunks = run(offline(tosfx.ToSFXCommand), args, ["_time", "host", "gauge_kb"], [rows])
+
+    summaries = [record for chunk in chunks[1:] for record in chunk]
+    assert summaries and all(int(summary["datapoints"]) > 0 for summary in summaries)
+    assert sum(int(summary["datapoints"]) for summary in summaries) == 300
+    assert sum(int(summary["rows"]) for summary in summaries) == 300
+
+
+def test_tosfx_reads_a_field_that_only_has_a_multivalue_column():
+    rows = [["1600000005", "h%d" % i, "", str(i)] for i in range(3)]
+    args = ["dry_run=true", "output=summary"]
+
+    chunks = run(offline(tosfx.ToSFXCommand), args, ["_time", "host", "__mv_extra", "gauge_kb"], [rows])
+
+    summaries = [record for chunk in chunks[1:] for record in chunk]
+    assert [(summary["rows"], summary["datapoints"]) for summary in summaries] == [("3", "3")]
+
+
+def test_tosfxevents_sends_batches_of_batch_size():
+    rows = [["1600000005", "deploy", "v%d" % i, "h%d" % i] for i in range(5)]
+    args = ["dry_run=true", "batch_size=2", "output=summary"]
+
+    chunks = run(offline(tosfxevents.ToSFXEventsCommand), args, ["_time", "event_type", "property_v", "host"], [rows])
+
+    summaries = [record for chunk in chunks[1:] for record in chunk]
+    assert [(summary["batch"], summary["events"]) for summary in summaries] == [("1", "2"), ("2", "2"), ("3", "1")]
+
+
+@pytest.mark.parametrize("command", sorted(COMMANDS))
+def test_stage_metrics_are_written_as_search_metrics(command):
+    header, chunks = chunked_rows(command)
+    output = io.BytesIO()
+
+    recording(COMMANDS[command], [])().process(["test"], make_input([], header, chunks), output)
+
+    metrics = {}
+    for metadata, _ in read_chunks(output.getvalue())[1:]:
+        for name, value in (metadata.get("inspector") or {}).items():
+            if name.startswith("metric."):
+                metrics.setdefault(name, []).append(value)
+    assert metrics and all(len(value) == 4 for values in metrics.values() for value in values)
+    # Running totals of the rows that went through each stage
+    size = sum(CHUNK_SIZES)
+    assert [value[3] for value in metrics["metric.parse"]] == [3, 5, 6]
+    assert metrics["metric.build"][-1][2:] == [size, size]
+
+
+def test_rate_limit_wait_is_written_as_a_search_metric():
+    header, chunks = chunked_rows("tosfx")
+    output = io.BytesIO()
+
+    recording(tosfx.ToSFXCommand, [])().process(["test"], make_input(["max_dpm=60000"], header, chunks), output)
+
+    (waited,) = [
+        metadata["inspector"]["metric.rate_limit_wait_seconds"]
+        for metadata, _ in read_chunks(output.getvalue())
+        if "metric.rate_limit_wait_seconds" in (metadata.get("inspector") or {})
+    ]
+    assert len(waited) == 4 and waited[0] >= 0 and waited[1:] == [None, None, None]
+
+
+def test_config_caches_the_access_token_but_not_the_ingest_url(tmp_path, monkeypatch):
+    monkeypatch.setattr(forwarder, "CONFIG_CACHE_PATH", str(tmp_path / "cache" / "config.json"))
+    monkeypatch.setattr(forwarder, "PASSWORDS_CONF_PATH", str(tmp_path / "passwords.conf"))
+    tokens, urls = [], []
+
+    class Passwords:  # pylint: disable=too-few-public-methods
+        def __getitem__(self, name):
+            assert name == "sfx_ingest_command:access_token:"
+            tokens.append("token-%d" % (len(tokens) + 1))
+            return SimpleNamespace(content={"clear_password": tokens[-1]})
+
+    def query(**_):
+        return [{"ingest_url": urls[-1]}]
+
+    class Configured(tosfx.ToSFXCommand):
+        service = SimpleNamespace(
+            storage_passwords=Passwords(),
+            kvstore={"sfx_ingest_config": SimpleNamespace(data=SimpleNamespace(query=query))},
+        )
+
+    configured = []
+    for url in ("https://ingest.us0.signalfx.com", "https://ingest.eu0.signalfx.com"):
+        urls.append(url)
+        command = Configured()
+        # Sets the options to their defaults as process() does
+        command.options.reset()
+        command.ensure_default_config()
+        configured.append((command.ingest_url, command.access_token))
+
+    assert configured == [
+        ("https://ingest.us0.signalfx.com", "token-1"),
+        ("https://ingest.eu0.signalfx.com", "token-1"),
+    ]
+
+
+@pytest.mark.parametrize("command", sorted(COMMANDS))
+def test_batches_are_posted_on_flush_and_on_the_final_chunk(command):
+    posts = []
+
+    batches = sent_batches(recording(COMMANDS[command], posts), command, [])
+
+    # One batch for each chunk rather than one for the whole search
+    assert batches == [(str(n), str(size), str(size), "200") for n, size in enumerate(CHUNK_SIZES, 1)]
+    assert len(posts) == len(CHUNK_SIZES)
+
+
+@pytest.mark.parametrize("output", ["all", "summary"])
+@pytest.mark.parametrize("command", sorted(COMMANDS))
+def test_results_of_batches_with_different_statuses_have_the_same_fields(command, output):
+    header, row = COMMAND_ROWS[command]
+    rows = [row(i) for i in range(3)]
+    args = ["batch_size=1", "output=" + output]
+
+    chunks = run(recording(COMMANDS[command], [], statuses=[200, 400, 200]), args, header, [rows])
+
+    results = [result for chunk in chunks[1:] for result in chunk]
+    # Every result has a response_error, empty unless its batch failed
+    assert [(result["status"], bool(result["response_error"])) for result in results] == [
+        ("200", False),
+        ("400", True),
+        ("200", False),
+    ]
+
+
+@pytest.mark.parametrize("command", sorted(COMMANDS))
+def test_batches_are_posted_to_the_backend_on_flush_and_on_the_final_chunk(command):
+    pytest.importorskip("sanic")
+    from tests.helpers import fake_backend  # pylint: disable=import-outside-toplevel
+
+    with fake_backend.start() as backend:
+        batches = sent_batches(offline(COMMANDS[command], backend.ingest_url), command, [])
+        received = backend.events if command == "tosfxevents" else backend.datapoints
+
+    assert batches == [(str(n), str(size), str(size), "200") for n, size in enumerate(CHUNK_SIZES, 1)]
+    assert sorted(item["dimensions"]["host"] for item in received) == sorted("h%d" % i for i in range(sum(CHUNK_SIZES)))
@@ -6,6 +6,14 @@ import threading
 from contextlib import contextmanager
 
 from sanic import Sanic, response
+from signalfx.generated_protocol_buffers import signal_fx_protocol_buffers_pb2 as sf_pbuf
+
+PROTOBUF_METRIC_TYPES = {
+    sf_pbuf.GAUGE: "gauge",
+    sf_pbuf.COUNTER: "counter",
+    sf_pbuf.ENUM: "enum",
+    sf_pbuf.CUMULATIVE_COUNTER: "cumulative_counter",
+}
 
 
 def bind_tcp_socket(host="127.0.0.1", port=0):
@@ -16,6 +24,33 @@ def bind_tcp_socket(host="127.0.0.1", port=0):
     return (sock, sock.getsockname()[1])
 
 
+# Converts a protobuf DataPointUploadMessage into the same form as datapoints
+# sent as JSON
+def _datapoints_from_protobuf(body):
+    message = sf_pbuf.DataPointUploadMessage()
+    message.ParseFromString(body)
+
+    out = []
+    for dp in message.datapoints:
+        for field in ("intValue", "doubleValue", "strValue"):
+            if dp.value.HasField(field):
+                value = getattr(dp.value, field)
+                break
+        else:
+            value = None
+
+        datapoint = {
+            "metric": dp.metric,
+            "value": value,
+            "dimensions": {dim.key: dim.value for dim in dp.dimensions},
+            "type": PROTOBUF_METRIC_TYPES[dp.metricType],
+        }
+        if dp.HasField("timestamp"):
+            datapoint["timestamp"] = dp.timestamp
+        out.append(datapoint)
+    return out
+
+
 # Fake the /v2/datapoint endpoint and just stick all of the metrics in a
 # list
 # pylint: disable=unused-variable
@@ -30,19 +65,21 @@ def _make_fake_ingest(datapoints, events):
 
     @app.post("/v2/datapoint")
     async def handle_datapoints(request):
-        is_json = "application/json" in request.headers.get("content-type")
-
-        if not is_json:
+        content_type = request.headers.get("content-type")
+
+        if "application/x-protobuf" in content_type:
+            out = _datapoints_from_protobuf(request.body)
+        elif "application/json" in content_type:
+            dp_map = json.loads(request.body)
+
+            out = []
+            for typ, dps in dp_map.items():
+                for dp in dps:
+                    dp["type"] = typ
+                    out.append(dp)
+        else:
             return response.text("Bad Content Type", status=400)
 
-        dp_map = json.loads(request.body)
-
-        out = []
-        for typ, dps in dp_map.items():
-            for dp in dps:
-                dp["type"] = typ
-                out.append(dp)
-
         datapoints.extend(out)
 
         return response.json("OK")
@@ -0,0 +1,85 @@
+"""
+Tests for the JSON results reader added to the splunklib vendored in
+signalfx-forwarder-app/bin/libs.
+"""
+import io
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+APP_LIBS_DIR = Path(__file__).parent.parent.resolve() / "signalfx-forwarder-app" / "bin" / "libs"
+sys.path.insert(0, str(APP_LIBS_DIR))
+
+# pylint: disable=wrong-import-position,import-error
+from splunklib import results  # noqa: E402
+
+
+def export_stream(*lines):
+    return io.BytesIO("".join(json.dumps(line) + "\n" for line in lines).encode("utf-8"))
+
+
+def test_json_results_reader_reads_preview_results():
+    stream = export_stream(
+        {"preview": True, "offset": 0, "result": {"host": "h1", "count": "1"}},
+        {"preview": True, "offset": 1, "result": {"host": "h2", "count": "1"}},
+        {"preview": False, "offset": 0, "lastrow": True, "result": {"host": "h1", "count": "2"}},
+    )
+    reader = results.JSONResultsReader(stream)
+
+    assert next(reader) == {"host": "h1", "count": "1"}
+    assert reader.is_preview is True
+    assert next(reader) == {"host": "h2", "count": "1"}
+    assert next(reader) == {"host": "h1", "count": "2"}
+    assert reader.is_preview is False
+    with pytest.raises(StopIteration):
+        next(reader)
+
+
+def test_json_results_reader_keeps_field_order():
+    stream = export_stream({"preview": False, "result": {"_time": "1", "zeta": "z", "alpha": "a"}})
+
+    assert [list(result) for result in results.JSONResultsReader(stream)] == [["_time", "zeta", "alpha"]]
+
+
+def test_json_results_reader_returns_messages():
+    stream = export_stream(
+        {"preview": False, "messages": [{"type": "INFO", "text": "started"}], "result": {"n": "1"}},
+        {"messages": [{"type": "WARN", "text": "slow"}, {"type": "DEBUG"}]},
+        {"preview": False, "init_offset": 0, "messages": [], "results": [{"n": "2"}, {"n": "3"}]},
+    )
+
+    assert list(results.JSONResultsReader(stream)) == [
+        results.Message("INFO", "started"),
+        {"n": "1"},
+        results.Message("WARN", "slow"),
+        results.Message("DEBUG", ""),
+        {"n": "2"},
+        {"n": "3"},
+    ]
+
+
+@pytest.mark.parametrize("data", [b"", b"\n", b"\n\r\n  \n"])
+def test_json_results_reader_reads_empty_streams(data):
+    reader = results.JSONResultsReader(io.BytesIO(data))
+
+    assert list(reader) == []
+    assert reader.is_preview is None
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 64 * 1024])
+def test_json_results_reader_joins_lines_split_across_reads(block_size):
+    cities = ["Zürich", "東京", "Oslo"]
+    lines = [{"preview": False, "offset": i, "result": {"city": city}} for i, city in enumerate(cities)]
+    data = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+    # Without the final newline the last line only ends with the stream
+    reader = results.JSONResultsReader(io.BytesIO(data[:-1]), block_size=block_size)
+
+    assert list(reader) == [{"city": city} for city in cities]
+
+
+def test_json_results_reader_reads_text_streams():
+    stream = io.StringIO('{"preview":false,"result":{"city":"Zürich"}}\n{"preview":false,"result":{"city":"Oslo"}}')
+
+    assert list(results.JSONResultsReader(stream, block_size=5)) == [{"city": "Zürich"}, {"city": "Oslo"}]
@@ -0,0 +1,200 @@
+"""
+Tests for the changes to splunklib.searchcommands vendored in
+signalfx-forwarder-app/bin/libs: reading and writing records of protocol
+version 2 without Splunk.
+"""
+import io
+import sys
+from collections import OrderedDict
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+APP_LIBS_DIR = Path(__file__).parent.parent.resolve() / "signalfx-forwarder-app" / "bin" / "libs"
+sys.path.insert(0, str(APP_LIBS_DIR))
+
+# pylint: disable=wrong-import-position,import-error,protected-access
+from splunklib.searchcommands import Configuration, EventingCommand  # noqa: E402
+from splunklib.searchcommands.internals import ChunkReader, LightweightRecord, RecordWriterV2, iter_lines  # noqa: E402
+from splunklib.searchcommands.search_command import SearchCommand  # noqa: E402
+
+
+@Configuration()
+class DictCommand(EventingCommand):
+    def transform(self, records):
+        return records
+
+
+@Configuration(lightweight_records=True)
+class LightweightCommand(EventingCommand):
+    def transform(self, records):
+        return records
+
+
+class GenericRecordWriter(RecordWriterV2):
+    """
+    Writes every record the general way, without compiled row writers
+    """
+
+    def _select_row_writer(self, record, fieldnames):
+        pass
+
+
+class TrickleInput(io.RawIOBase):
+    """
+    A binary stream that returns at most `step` bytes from each read
+    """
+
+    def __init__(self, data, step):
+        self._data = io.BytesIO(data)
+        self._step = step
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._data.read(min(len(b), self._step))
+        b[: len(data)] = data
+        return len(data)
+
+    def readline(self, size=-1):
+        return self._data.readline(size)
+
+
+def chunk(metadata, body):
+    metadata, body = metadata.encode("utf-8"), body.encode("utf-8")
+    return b"chunked 1.0,%d,%d\n%s%s" % (len(metadata), len(body), metadata, body)
+
+
+def write(writer_class, records):
+    output = io.BytesIO()
+    writer = writer_class(output)
+    writer.write_records(records)
+    writer.flush(finished=True)
+    return output.getvalue()
+
+
+def test_compiled_row_writer_matches_the_general_path():
+    records = [
+        OrderedDict([("_time", "1600000000"), ("host", "h1"), ("count", 3), ("ratio", 0.5), ("status", None)]),
+        OrderedDict([("_time", "1600000001"), ("host", ["h1", "h2"]), ("count", 10 ** 20), ("ratio", 1.5)]),
+        OrderedDict([("_time", "1600000002"), ("host", ["h3"]), ("count", True), ("ratio", Decimal("2.5"))]),
+        OrderedDict([("_time", "1600000003"), ("host", "été"), ("count", ""), ("status", {"code": 200})]),
+        OrderedDict([("_time", "1600000004"), ("host", [None, "$h$"]), ("count", -1), ("ratio", float("inf"))]),
+        OrderedDict([("_time", "1600000005"), ("host", []), ("count", 0), ("ratio", -0.0), ("status", 200)]),
+    ]
+
+    assert write(RecordWriterV2, records) == write(GenericRecordWriter, records)
+
+
+def test_compiled_row_writer_matches_the_general_path_for_lightweight_records():
+    header = LightweightRecord.Header(["_time", "host", "count"])
+    other_header = LightweightRecord.Header(["_time", "count", "host"])
+
+    def records():
+        rows = [
+            (header, ["1600000000", "h1", "1"], {"status": 200}),
+            (header, ["1600000001", ["h1", "h2"], "2"], {"status": 400, "response_error": b"bad"}),
+            (header, ["1600000002", None, 3], {}),
+            (other_header, ["1600000003", "4", "h4"], {"status": 200}),
+            (header, ["1600000004", "h5", 5.5], {"status": None}),
+        ]
+        for record_header, row, extras in rows:
+            record = LightweightRecord(record_header, row)
+            for name, value in extras.items():
+                record[name] = value
+            yield record
+
+    assert write(RecordWriterV2, records()) == write(GenericRecordWriter, records())
+
+
+def test_chunk_reader_reads_bodies_split_within_a_character():
+    body = "_time,city\n1600000000,Zürich\n1600000001,東京\n"
+    # Reads of 3 bytes split both the two byte ü and the three byte 東 and 京
+    reader = ChunkReader(TrickleInput(chunk('{"action":"execute"}', body), step=3))
+
+    metadata, read = SearchCommand._read_chunk(reader)
+
+    assert metadata.action == "execute"
+    assert read == body
+
+
+def test_chunk_reader_reads_empty_bodies():
+    reader = ChunkReader(io.BytesIO(chunk('{"action":"getinfo"}', "") + chunk('{"finished":true}', "")))
+
+    assert SearchCommand._read_chunk(reader)[1] == ""
+    metadata, body = SearchCommand._read_chunk(reader)
+    assert metadata.finished is True and body == ""
+    assert SearchCommand._read_chunk(reader) is None
+
+
+def test_chunk_reader_reuses_its_buffer_across_chunks():
+    bodies = ["a" * 10, "b" * 16, "c" * 40, "d" * 5]
+    reader = ChunkReader(io.BytesIO(b"".join(chunk("{}", body) for body in bodies)), buffer_size=16)
+    buffers = []
+
+    for body in bodies:
+        assert SearchCommand._read_chunk(reader)[1] == body
+        buffers.append(reader._buffer)
+
+    assert buffers[0] is buffers[1]
+    assert len(buffers[2]) == 40 and buffers[2] is buffers[3]
+
+
+def test_chunk_reader_rejects_a_truncated_body():
+    reader = ChunkReader(io.BytesIO(chunk("{}", "abcdef")[:-2]))
+
+    with pytest.raises(RuntimeError, match="Expected 6 bytes, but the input ended after 4"):
+        SearchCommand._read_chunk(reader)
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["", "\n", "a", "a\nb", "a\nb\n", "header\n" + "row,é,東京\n" * 20, "\n\nlong line without newline" * 3],
+)
+@pytest.mark.parametrize("block_size", [1, 4, 64 * 1024])
+def test_iter_lines_matches_string_io(text, block_size):
+    assert list(iter_lines(text, block_size=block_size)) == list(io.StringIO(text))
+
+
+def test_lightweight_record_mapping():
+    record = LightweightRecord(LightweightRecord.Header(["_time", "host"]), ["1600000000", "h1"])
+
+    assert "host" in record and "status" not in record
+    assert record.get("host") == record["host"] == "h1"
+    assert record.get("status") is None and record.get("status", 0) == 0
+    with pytest.raises(KeyError):
+        record["status"]  # pylint: disable=pointless-statement
+
+    record["host"] = "h2"
+    record["status"] = 200
+    assert record.row == ["1600000000", "h2"]
+    assert "status" in record and record["status"] == 200
+    assert record.items() == [("_time", "1600000000"), ("host", "h2"), ("status", 200)]
+    assert record.keys() == ["_time", "host", "status"] and len(record) == 3
+    assert record.fieldnames == ("_time", "host")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "_time,host\n1,h1\n2,h2\n",
+        "_time,host,__mv__time,__mv_host\n1,h1,,\n2,h2,,$h2$;$h3$\n",
+        "_time,host,host\n1,h1,h2\n",
+        "_time,host,__mv_host,host\n1,h1,,h2\n2,h3,$h3$;$h4$,h5\n",
+        "_time,__mv_tag,__mv_tag\n1,$a$;$b$,\n2,,$c$;$d$\n3,$e$;$f$,$g$;$h$\n",
+        "_time,__mv_tag\n1,$a$;$b$\n2,\n",
+        "_time\n",
+    ],
+)
+def test_lightweight_records_match_ordered_dict_records(text):
+    expected = [list(record.items()) for record in DictCommand()._records_protocol_v1(io.StringIO(text))]
+    records = list(LightweightCommand()._records_protocol_v1(io.StringIO(text)))
+
+    assert all(type(record) is LightweightRecord for record in records)  # pylint: disable=unidiomatic-typecheck
+    # Multivalue fields without a value are left out of ordered dict records but kept as None, or as an empty value
+    # when the field only has a multivalue column
+    assert [[(k, v) for k, v in record.items() if v not in (None, "")] for record in records] == [
+        [(k, v) for k, v in record if v != ""] for record in expected
+    ]
@@ -0,0 +1,417 @@
+"""
+Unit tests for the helpers in signalfx-forwarder-app/bin/libs/sfxlib that
+don't need Splunk or a fake backend.
+"""
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import pytest
+
+APP_LIBS_DIR = Path(__file__).parent.parent.resolve() / "signalfx-forwarder-app" / "bin" / "libs"
+sys.path.insert(0, str(APP_LIBS_DIR))
+
+# pylint: disable=wrong-import-position,import-error
+from sfxlib import compression  # noqa: E402
+from sfxlib.config_cache import ConfigCache, file_fingerprint  # noqa: E402
+from sfxlib.datapoints import DimensionCache, FieldPlan, encode_json  # noqa: E402
+from sfxlib.debuglog import SampledLog  # noqa: E402
+from sfxlib.metrics import StageMetrics  # noqa: E402
+from sfxlib.protobuf import encode_datapoints, encode_varint  # noqa: E402
+from sfxlib.ratelimit import RateLimiter  # noqa: E402
+from sfxlib.retry import RetryPolicy, Spool, parse_retry_after, post_with_retry  # noqa: E402
+from sfxlib.rollup import Rollup  # noqa: E402
+from sfxlib.sender import OUTPUT_MODES, BatchSender, PendingBatch  # noqa: E402
+from splunklib.searchcommands import SearchMetric  # noqa: E402
+
+
+class FakeResponse:  # pylint: disable=too-few-public-methods
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class FakeSession:
+    """
+    Returns the given responses in order and records each request
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def post(self, url, headers=None, data=None):
+        self.requests.append((url, dict(headers), data))
+        return self.responses.pop(0)
+
+
+def test_batch_sender_marks_events_with_batch_status():
+    def send(_, payload):
+        return FakeResponse(200) if payload == "good" else FakeResponse(400, b"bad payload")
+
+    sender = BatchSender(send, concurrency=2)
+    try:
+        good = sender.submit("good", [{"n": 1}, {"n": 2}])
+        bad = sender.submit("bad", [{"n": 3}])
+        for batch in (good, bad):
+            batch.wait()
+            batch.mark_events()
+    finally:
+        sender.close()
+
+    assert [e["status"] for e in good.events] == [200, 200]
+    assert [e["response_error"] for e in good.events] == ["", ""]
+    assert bad.events == [{"n": 3, "status": 400, "response_error": b"bad payload"}]
+
+
+def test_pending_batch_results_by_output_mode():
+    good = PendingBatch("payload", [{"n": 1}, {"n": 2}], size=5)
+    good.finish(FakeResponse(200))
+    bad = PendingBatch("payload", [{"n": 3}], size=1)
+    bad.finish(FakeResponse(400, b"bad payload"))
+
+    assert good.results("errors", 1) == ()
+    assert bad.results("errors", 2) == [{"n": 3, "status": 400, "response_error": b"bad payload"}]
+    assert [e["status"] for e in good.results("all", 1)] == [200, 200]
+
+    (summary,) = bad.results("summary", 2, size_name="events")
+    assert list(summary)[1:] == ["batch", "rows", "events", "bytes", "seconds", "status", "response_error"]
+    assert (summary["batch"], summary["rows"], summary["events"], summary["status"]) == (2, 1, 1, 400)
+    assert summary["response_error"] == b"bad payload"
+    (summary,) = good.results("summary", 1)
+    assert (summary["status"], summary["response_error"]) == (200, "")
+
+    failed = PendingBatch("payload", [], rows=3)
+    failed.finish(error=ValueError("unreachable"))
+    for output in OUTPUT_MODES:
+        with pytest.raises(ValueError):
+            failed.results(output, 3)
+
+
+def test_batch_sender_sends_concurrently():
+    concurrency = 3
+    barrier = threading.Barrier(concurrency, timeout=5)
+
+    def send(_, payload):
+        barrier.wait()
+        return FakeResponse(200, payload)
+
+    sender = BatchSender(send, concurrency=concurrency)
+    try:
+        batches = [sender.submit(i, [{}]) for i in range(concurrency)]
+        for batch in batches:
+            batch.wait()
+    finally:
+        sender.close()
+
+    assert [batch.response.content for batch in batches] == list(range(concurrency))
+
+
+def test_retry_policy_honours_retry_after():
+    policy = RetryPolicy(max_attempts=3, max_delay=10)
+    assert policy.delay(0, FakeResponse(429, headers={"Retry-After": "2"})) == 2
+    assert policy.delay(0, FakeResponse(429, headers={"Retry-After": "60"})) is None
+    assert policy.delay(2, FakeResponse(503)) is None
+    assert 0 <= policy.delay(1, FakeResponse(503)) <= 1
+
+
+def test_parse_retry_after_http_date():
+    assert parse_retry_after(FakeResponse(503, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert parse_retry_after(FakeResponse(503)) is None
+
+
+def test_post_with_retry_spools_after_last_attempt(tmp_path):
+    session = FakeSession(FakeResponse(503), FakeResponse(503))
+    spool = Spool(str(tmp_path))
+    headers = {"X-SF-TOKEN": "secret", "Content-Type": "application/json"}
+
+    response = post_with_retry(
+        session, "https://ingest/v2/datapoint", headers, b"body", RetryPolicy(max_attempts=2), spool, sleep=lambda _: None
+    )
+
+    assert response.status_code == 503
+    assert len(session.requests) == 2
+    [path] = spool.paths()
+    assert b"secret" not in Path(path).read_bytes()
+    assert Spool.read(path) == ("https://ingest/v2/datapoint", {"Content-Type": "application/json"}, b"body")
+
+
+def test_spool_replay_keeps_requests_that_fail_again(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.write("https://ingest/v2/datapoint", {}, b"first")
+    spool.write("https://ingest/v2/datapoint", {}, b"second")
+    session = FakeSession(FakeResponse(200), FakeResponse(503))
+
+    assert spool.replay(session, "token", RetryPolicy(max_attempts=1)) == (1, 1)
+    assert [data for _, _, data in session.requests] == [b"first", b"second"]
+    assert session.requests[0][1] == {"X-SF-TOKEN": "token"}
+    assert [Spool.read(path)[2] for path in spool.paths()] == [b"second"]
+
+
+def test_spool_drops_the_oldest_requests_over_its_limits(tmp_path, caplog):
+    spool = Spool(str(tmp_path), max_age=60)
+    paths = [spool.write("https://ingest/v2/datapoint", {}, b"x" * 40) for _ in range(3)]
+    size = os.path.getsize(paths[0])
+    assert spool.paths() == paths
+
+    # A fourth request takes the spool over max_bytes, so the oldest one goes
+    spool.max_bytes = 3 * size
+    paths.append(spool.write("https://ingest/v2/datapoint", {}, b"x" * 40))
+    assert spool.paths() == paths[1:]
+    assert "status=dropped, action=spool_trim, path=%s, reason=max_bytes" % paths[0] in caplog.text
+
+    expired = time.time() - 120
+    os.utime(paths[1], (expired, expired))
+    assert spool.trim() == 1
+    assert spool.paths() == paths[2:]
+    assert "reason=max_age" in caplog.text
+
+
+def test_spool_replay_skips_expired_requests(tmp_path):
+    spool = Spool(str(tmp_path), max_age=60)
+    expired = time.time() - 120
+    os.utime(spool.write("https://ingest/v2/datapoint", {}, b"old"), (expired, expired))
+    spool.write("https://ingest/v2/datapoint", {}, b"new")
+    session = FakeSession(FakeResponse(200))
+
+    assert spool.replay(session, "token", RetryPolicy(max_attempts=1)) == (1, 0)
+    assert [data for _, _, data in session.requests] == [b"new"]
+    assert spool.paths() == []
+
+
+def test_config_cache_expires_on_ttl_and_fingerprint(tmp_path):
+    path = str(tmp_path / "cache" / "config.json")
+    conf = tmp_path / "passwords.conf"
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return "token-%d" % len(fetches)
+
+    assert ConfigCache(path, fingerprint=file_fingerprint(str(conf))).get("access_token", fetch) == "token-1"
+    assert ConfigCache(path, fingerprint=file_fingerprint(str(conf))).get("access_token", fetch) == "token-1"
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    conf.write_text("[credential::sfx_ingest_command:access_token:]")
+    assert ConfigCache(path, fingerprint=file_fingerprint(str(conf))).get("access_token", fetch) == "token-2"
+    assert ConfigCache(path, ttl=0, fingerprint=file_fingerprint(str(conf))).get("access_token", fetch) == "token-3"
+
+    cache = ConfigCache(path, fingerprint=file_fingerprint(str(conf)))
+    cache.invalidate()
+    assert cache.get("access_token", fetch) == "token-4"
+    assert cache.get("ingest_url", lambda: None) is None
+    assert len(fetches) == 4
+
+
+def test_rate_limiter_paces_datapoints_and_requests():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(max_dpm=600, max_requests_per_sec=2, clock=lambda: now[0], sleep=sleep)
+
+    assert limiter.wait(10) == 0
+    assert limiter.wait(20) == 2.0
+    assert limiter.wait(0) == 0
+    assert limiter.wait(0) == 0
+    assert limiter.wait(0) == 0.5
+    now[0] += 10
+    assert limiter.wait(10) == 0
+    assert sleeps == [2.0, 0.5]
+    assert limiter.waited == 2.5
+
+
+def test_sampled_log_samples_rate_limits_and_restores_logger():
+    logger = logging.getLogger("sfxlib_test.sampled_log")
+    records = []
+    handler = logging.Handler()
+    handler.emit = lambda record: records.append(record.getMessage())
+    logger.addHandler(handler)
+    now = [0.0]
+
+    log = SampledLog(logger, sample_every=10, max_per_second=2, clock=lambda: now[0])
+    log.debug("not started")
+    log.start()
+    for i in range(100):
+        log.debug("event %d", i)
+    now[0] += 1
+    log.debug("event 100")
+    log.stop()
+
+    assert records[:2] == ["event 0", "event 10"]
+    assert records[2:] == ["event 100", "action=debug_log_summary, seen=101, logged=3, dropped=8"]
+    assert logger.handlers == [handler] and logger.propagate
+
+
+def test_encode_varint():
+    assert encode_varint(1) == b"\x01"
+    assert encode_varint(300) == b"\xac\x02"
+    assert encode_varint(-1) == b"\xff" * 9 + b"\x01"
+
+
+def test_encode_datapoints_decodes_with_signalfx_protobuf():
+    sf_pbuf = pytest.importorskip("signalfx.generated_protocol_buffers.signal_fx_protocol_buffers_pb2")
+    dims = {"host": "h1", "series": "main"}
+    payload = OrderedDict(
+        [
+            ("gauge", [("kb", 1.5, 1600000000000, dims)]),
+            ("counter", [("ev", -3, None, dims)]),
+        ]
+    )
+
+    message = sf_pbuf.DataPointUploadMessage()
+    message.ParseFromString(encode_datapoints(payload))
+
+    gauge, counter = message.datapoints
+    assert (gauge.metric, gauge.timestamp, gauge.value.doubleValue, gauge.metricType) == (
+        "kb",
+        1600000000000,
+        1.5,
+        sf_pbuf.GAUGE,
+    )
+    assert not counter.HasField("timestamp")
+    assert (counter.value.intValue, counter.metricType) == (-3, sf_pbuf.COUNTER)
+    assert {d.key: d.value for d in counter.dimensions} == dims
+
+
+def test_dimension_cache_interns_equal_dimension_sets():
+    cache = DimensionCache(max_size=2)
+    first = cache.intern([("host", "h1"), ("series", "main")])
+
+    assert cache.intern((("host", "h1"), ("series", "main"))) is first
+    assert first == {"host": "h1", "series": "main"}
+    assert json.loads(first.json) == first
+
+    cache.intern([("host", "h2")])
+    cache.intern([("host", "h3")])
+    assert len(cache) == 1
+
+
+def test_dimension_cache_interns_multivalue_dimensions():
+    plan = FieldPlan.compile(("_time", "gauge_kb", "host", "tag"))
+    _, items, _ = plan.apply(("1600000000", "1", "h1", ["a", "b"]))
+    cache = DimensionCache()
+
+    dims = cache.intern(items)
+    assert cache.intern(list(items)) is dims
+    assert json.loads(dims.json) == {"host": "h1", "tag": ["a", "b"]}
+
+    payload = OrderedDict([("gauge", [("kb", 1, None, dims)])])
+    assert json.loads(encode_json(payload))["gauge"][0]["dimensions"] == {"host": "h1", "tag": ["a", "b"]}
+    assert b"a,b" in encode_datapoints(payload)
+
+
+def test_encode_json_splices_dimensions():
+    dims = DimensionCache().intern([("host", "h1")])
+    payload = OrderedDict([("gauge", [("kb", 1.5, 1600000000000, dims), ("kb", float("nan"), None, dims)])])
+
+    decoded = json.loads(encode_json(payload))
+
+    assert decoded["gauge"][0] == {"metric": "kb", "value": 1.5, "timestamp": 1600000000000, "dimensions": dims}
+    assert "timestamp" not in decoded["gauge"][1]
+
+
+def test_field_plan_classifies_header_once():
+    fieldnames = ("_time", "gauge_kb", "counter_ev", "cumulative_counter_age", "host.name", "punct", "date_hour", "_raw")
+    plan = FieldPlan.compile(fieldnames)
+
+    assert FieldPlan.compile(tuple(fieldnames)) is plan
+    assert plan.time_index == 0
+    assert plan.dimensions == [(4, "host_name")]
+
+    timestamp, dimensions, metrics = plan.apply(("1600000000.5", "1.5", "3", "", "h1", "x", "1", "raw"))
+    assert timestamp == 1600000000500
+    assert dimensions == [("host_name", "h1")]
+    assert metrics == [("gauge", [("kb", 1.5)]), ("counter", [("ev", 3)])]
+
+    assert plan.apply(("1600000000", "", "", "", "h1", "", "", "")) == (None, None, [])
+
+
+@pytest.mark.parametrize("gauge, expected", [("last", 3), ("avg", 2.0), ("min", 1), ("max", 3)])
+def test_rollup_aggregates_each_series_and_bucket(gauge, expected):
+    cache = DimensionCache()
+    host = cache.intern([("host", "h1")])
+    rollup = Rollup(10000, gauge=gauge)
+
+    assert rollup.add(1600000009000, host, [("gauge", [("kb", 3)]), ("counter", [("ev", 1)])])[0] == 2
+    assert rollup.add(1600000001000, host, [("gauge", [("kb", 1)]), ("counter", [("ev", 2)])]) == (0, 0)
+    assert rollup.add(1600000005000, host, [("gauge", [("kb", 2)])]) == (0, 0)
+    assert rollup.add(1599999999000, cache.intern([("host", "h1")]), [("counter", [("ev", 4)])])[0] == 1
+
+    payload = rollup.payload()
+    assert list(payload) == ["gauge", "counter"]
+    assert list(payload["gauge"]) == [("kb", expected, 1600000000000, host)]
+    assert list(payload["counter"]) == [("ev", 4, 1599999990000, host), ("ev", 3, 1600000000000, host)]
+
+
+def test_rollup_carries_the_open_bucket_over():
+    host = DimensionCache().intern([("host", "h1")])
+    rollup = Rollup(10000)
+    rollup.add(1600000015000, host, [("counter", [("ev", 1)])])
+    rollup.add(1600000005000, host, [("counter", [("ev", 2)])])
+    size = rollup.size
+
+    carried = rollup.split_open_bucket()
+    carried.add(1600000001000, host, [("counter", [("ev", 3)])])
+
+    assert list(rollup.payload()["counter"]) == [("ev", 1, 1600000010000, host)]
+    assert list(carried.payload()["counter"]) == [("ev", 5, 1600000000000, host)]
+    assert rollup.size == carried.size == size / 2
+
+
+def test_rollup_sends_an_open_bucket_that_fills_a_batch():
+    cache = DimensionCache()
+    rollup = Rollup(10000)
+    for i in range(300):
+        rollup.add(1600000005000, cache.intern([("host", "h%d" % i)]), [("gauge", [("kb", i)])])
+    size = rollup.size
+
+    assert len(rollup.split_open_bucket(max_datapoints=100)) == 0
+    assert len(rollup.split_open_bucket(max_size=size)) == 0
+    assert len(rollup) == 300 and rollup.size == size
+
+    carried = rollup.split_open_bucket(max_datapoints=301, max_size=size + 1)
+    assert len(carried) == 300 and len(rollup) == 0
+
+
+def test_compress_buffers_fragments(monkeypatch):
+    monkeypatch.setattr(compression, "BUFFER_SIZE", 10)
+    fragments = ["fragment %d," % i for i in range(100)]
+
+    body, encoding = compression.compress(iter(fragments), "gzip", 1)
+    assert encoding == "gzip"
+    assert gzip.decompress(body) == "".join(fragments).encode("utf-8")
+
+    assert compression.compress(iter([b"a", b"b"]), "none") == (b"ab", None)
+
+
+def test_stage_metrics_report_totals_and_chunk_changes():
+    metrics = StageMetrics()
+    compression.compress(iter(["abc", "def"]), "gzip", 1, metrics=metrics)
+    assert metrics.get("bytes_raw") == 6
+    assert metrics.get("bytes_compressed") > 0
+    stages = [("gzip", "gzip_seconds", None, "bytes_raw", "bytes_compressed"), ("build", None, None, None, "rows")]
+
+    metrics.add("rows", 3)
+    reported = []
+    metrics.report(lambda name, value: reported.append((name, value)), stages)
+    assert [name for name, _ in reported] == ["gzip", "chunk.gzip", "build", "chunk.build"]
+    assert all(isinstance(metric, SearchMetric) for _, metric in reported)
+    assert ("build", (None, None, None, 3)) in reported and ("chunk.build", (None, None, None, 3)) in reported
+
+    metrics.add("rows", 2)
+    reported = {}
+    metrics.report(reported.__setitem__, stages)
+    assert reported["build"].output_count == 5 and reported["chunk.build"].output_count == 2
+    assert reported["chunk.gzip"].elapsed_seconds == 0 and reported["chunk.gzip"].input_count == 0
+    assert reported["gzip"].input_count == 6 and reported["gzip"].invocation_count is None
@@ -83,6 +83,31 @@ def test_signalfx_forwarder_app(splunk_version):
                 p(has_datapoint, backend, metric="max_age", metric_type="cumulative_counter", has_timestamp=False)
             )
 
+            # test tosfx query with protobuf encoding
+            backend.reset_datapoints()
+            cmd = (
+                "search 'index=_internal series=* | table _time kb ev max_age | `gauge(kb)` "
+                "| `counter(ev)` | `cumulative_counter(max_age)` | tosfx format=protobuf'"
+            )
+            code, output = run_splunk_cmd(cont, cmd)
+            assert code == 0, output.decode("utf-8")
+            assert wait_for(p(has_datapoint, backend, metric="kb", metric_type="gauge", has_timestamp=True))
+            assert wait_for(p(has_datapoint, backend, metric="ev", metric_type="counter", has_timestamp=True))
+            assert wait_for(
+                p(has_datapoint, backend, metric="max_age", metric_type="cumulative_counter", has_timestamp=True)
+            )
+
+            # test the distributable tosfxstream command
+            backend.reset_datapoints()
+            cmd = (
+                "search 'index=_internal series=* | table _time kb ev max_age | `gauge(kb)` "
+                "| `counter(ev)` | `cumulative_counter(max_age)` | tosfxstream'"
+            )
+            code, output = run_splunk_cmd(cont, cmd)
+            assert code == 0, output.decode("utf-8")
+            assert wait_for(p(has_datapoint, backend, metric="kb", metric_type="gauge", has_timestamp=True))
+            assert wait_for(p(has_datapoint, backend, metric="ev", metric_type="counter", has_timestamp=True))
+
             # test tosfxevents query with time
             cmd = (
                 "search '| makeresults | eval event_sfx_event=\"custom\", message=\"This is a test event for emulating a search\", stack=\"stacktest\", value=\"1234\" | tosfxevents'"